@@ -0,0 +1,69 @@
+"""baseline schema
+
+Tables as originally created by Base.metadata.create_all.
+Databases that already have them should run `alembic stamp 0001` once.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "trim_master",
+        sa.Column("id", sa.Integer(), primary_key=True, index=True),
+        sa.Column("make", sa.String(), nullable=False),
+        sa.Column("model", sa.String(), nullable=False),
+        sa.Column("trim_name", sa.String(), nullable=False),
+        sa.Column("year_start", sa.Integer(), nullable=True),
+        sa.Column("year_end", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.TIMESTAMP()),
+    )
+    op.create_table(
+        "trim_alias",
+        sa.Column("id", sa.Integer(), primary_key=True, index=True),
+        sa.Column("trim_master_id", sa.Integer(), sa.ForeignKey("trim_master.id"), nullable=False),
+        sa.Column("alias", sa.String(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP()),
+    )
+    op.create_table(
+        "listings",
+        sa.Column("ad_id", sa.String(), primary_key=True, index=True),
+        sa.Column("title", sa.String()),
+        sa.Column("brand", sa.String()),
+        sa.Column("model", sa.String()),
+        sa.Column("year", sa.Integer()),
+        sa.Column("website", sa.String()),
+        sa.Column("trim", sa.String()),
+        sa.Column("normalized_trim", sa.String()),
+        sa.Column("trim_confidence", sa.Float()),
+        sa.Column("assignment_method", sa.String()),
+        sa.Column("needs_review", sa.Boolean(), default=False),
+        sa.Column("last_reviewed_at", sa.TIMESTAMP()),
+        sa.Column("processed_at", sa.TIMESTAMP()),
+    )
+    op.create_table(
+        "trim_history",
+        sa.Column("id", sa.Integer(), primary_key=True, index=True),
+        sa.Column("listing_id", sa.String(), sa.ForeignKey("listings.ad_id"), nullable=False),
+        sa.Column("old_trim", sa.String()),
+        sa.Column("new_trim", sa.String(), nullable=False),
+        sa.Column("changed_by", sa.String(), nullable=False),
+        sa.Column("changed_at", sa.TIMESTAMP()),
+    )
+
+
+def downgrade():
+    op.drop_table("trim_history")
+    op.drop_table("listings")
+    op.drop_table("trim_alias")
+    op.drop_table("trim_master")
@@ -0,0 +1,34 @@
+"""partial index for the unprocessed listings queue
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction; listings is large and live
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_listings_unprocessed", "listings", ["ad_id"],
+            postgresql_where=sa.text("processed_at IS NULL OR needs_review IS TRUE"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_listings_unprocessed", table_name="listings",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
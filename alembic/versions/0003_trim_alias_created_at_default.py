@@ -0,0 +1,22 @@
+"""server-side default for trim_alias.created_at
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column("trim_alias", "created_at", server_default=sa.func.now())
+
+
+def downgrade():
+    op.alter_column("trim_alias", "created_at", server_default=None)
@@ -0,0 +1,38 @@
+"""normalized generated columns on trim_master / trim_alias
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def _norm(col):
+    return sa.Computed(f"regexp_replace(lower({col}), '[^a-z0-9]', '', 'g')", persisted=True)
+
+
+def upgrade():
+    op.add_column("trim_master", sa.Column("make_norm", sa.String(), _norm("make")))
+    op.add_column("trim_master", sa.Column("model_norm", sa.String(), _norm("model")))
+    op.add_column("trim_master", sa.Column("trim_norm", sa.String(), _norm("trim_name")))
+    op.add_column("trim_alias", sa.Column("alias_norm", sa.String(), _norm("alias")))
+
+    op.create_index("ix_trim_master_norm", "trim_master", ["make_norm", "model_norm", "trim_norm"])
+    op.create_index("ix_trim_alias_master_norm", "trim_alias", ["trim_master_id", "alias_norm"])
+
+
+def downgrade():
+    op.drop_index("ix_trim_alias_master_norm", table_name="trim_alias")
+    op.drop_index("ix_trim_master_norm", table_name="trim_master")
+
+    op.drop_column("trim_alias", "alias_norm")
+    op.drop_column("trim_master", "trim_norm")
+    op.drop_column("trim_master", "model_norm")
+    op.drop_column("trim_master", "make_norm")
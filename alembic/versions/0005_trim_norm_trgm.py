@@ -0,0 +1,31 @@
+"""pg_trgm indexes on normalized trim names / aliases
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-15
+"""
+from alembic import op
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # GiST (not GIN) so ORDER BY trim_norm <-> :q can be answered from the index
+    op.create_index(
+        "ix_trim_master_trim_norm_trgm", "trim_master", ["trim_norm"],
+        postgresql_using="gist", postgresql_ops={"trim_norm": "gist_trgm_ops"},
+    )
+    op.create_index(
+        "ix_trim_alias_alias_norm_trgm", "trim_alias", ["alias_norm"],
+        postgresql_using="gist", postgresql_ops={"alias_norm": "gist_trgm_ops"},
+    )
+
+
+def downgrade():
+    op.drop_index("ix_trim_alias_alias_norm_trgm", table_name="trim_alias")
+    op.drop_index("ix_trim_master_trim_norm_trgm", table_name="trim_master")
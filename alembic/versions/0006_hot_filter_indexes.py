@@ -0,0 +1,46 @@
+"""indexes for hot filter columns, unique alias per trim
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-15
+"""
+from alembic import op
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # add_alias always checked for duplicates, but nothing enforced it; keep the oldest row
+    op.execute("""
+        DELETE FROM trim_alias a
+        USING trim_alias b
+        WHERE a.trim_master_id = b.trim_master_id
+          AND a.alias = b.alias
+          AND a.id > b.id
+    """)
+    op.create_unique_constraint("uq_trim_alias", "trim_alias", ["trim_master_id", "alias"])
+    op.create_index("ix_trim_master_make_model", "trim_master", ["make", "model"])
+
+    # listings is large and live
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_listings_brand_model", "listings", ["brand", "model"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_listings_brand_model", table_name="listings",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+    op.drop_index("ix_trim_master_make_model", table_name="trim_master")
+    op.drop_constraint("uq_trim_alias", "trim_alias", type_="unique")
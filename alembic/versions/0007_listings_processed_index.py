@@ -0,0 +1,34 @@
+"""partial index for the processed listings view
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_listings_processed_method_conf", "listings",
+            ["assignment_method", "trim_confidence"],
+            postgresql_where=sa.text("processed_at IS NOT NULL"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_listings_processed_method_conf", table_name="listings",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
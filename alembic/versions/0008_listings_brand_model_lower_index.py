@@ -0,0 +1,33 @@
+"""case-insensitive brand/model index for the processed listings view
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_listings_brand_model_lower", "listings",
+            [sa.text("lower(brand)"), sa.text("lower(model)")],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_listings_brand_model_lower", table_name="listings",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,25 @@
+"""widen the trim_master make/model index with trim_name
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-15
+"""
+from alembic import op
+
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # add_trim's duplicate check filters on all three columns; the wider index
+    # still serves (make, model) lookups through its leading columns
+    op.create_index("ix_trim_master_make_model_trim", "trim_master", ["make", "model", "trim_name"])
+    op.drop_index("ix_trim_master_make_model", table_name="trim_master")
+
+
+def downgrade():
+    op.create_index("ix_trim_master_make_model", "trim_master", ["make", "model"])
+    op.drop_index("ix_trim_master_make_model_trim", table_name="trim_master")
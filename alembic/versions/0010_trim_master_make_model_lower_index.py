@@ -0,0 +1,25 @@
+"""case-insensitive make/model index for the aliases listing
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_trim_master_make_model_lower", "trim_master",
+        [sa.text("lower(make)"), sa.text("lower(model)")],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_trim_master_make_model_lower", table_name="trim_master")
@@ -13,7 +13,21 @@ if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set in environment variables")
 
 # Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+# values_plus_batch: INSERT executemany is folded into multi-row VALUES pages,
+# UPDATE/DELETE executemany is sent via psycopg2's execute_batch
+engine = create_engine(
+    DATABASE_URL,
+    executemany_mode="values_plus_batch",
+    insertmanyvalues_page_size=1000,
+    executemany_batch_page_size=500,
+    # Pool sized for concurrent route handlers; pre_ping drops dead
+    # connections on checkout, recycle avoids server-side idle timeouts
+    pool_size=10,
+    max_overflow=20,
+    pool_timeout=30,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -1,17 +1,29 @@
+from sqlalchemy import insert, select, text
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timezone
+import warnings
+from typing import Iterator, List, Optional
 from app import models
 
+def utcnow() -> datetime:
+    """
+    Current UTC time as a naive datetime: the TIMESTAMP columns store UTC without a zone.
+    Replaces datetime.utcnow(), which is deprecated since Python 3.12.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 # ----------------------
-# Get unprocessed listings
+# Stream unprocessed listings
 # ----------------------
-def get_unprocessed_listings(db: Session, limit: int = 500, offset: int = 0):
+def iter_unprocessed_listings(db: Session, chunk: int = 1000, limit: Optional[int] = None) -> Iterator[List]:
     """
-    Fetch listings that are either unprocessed or marked as needing review.
-    Returns a list of tuples: (ad_id, brand, model, year, trim)
+    Stream unprocessed listings through a server-side cursor, `chunk` rows at a time.
+    Yields lists of (ad_id, brand, model, year, trim, title, website) rows.
+    Memory stays bounded by `chunk` and there is no OFFSET/re-query (see stream_partitions).
     """
-    rows = (
-        db.query(
+    stmt = (
+        select(
             models.Listings.ad_id,
             models.Listings.brand,
             models.Listings.model,
@@ -20,21 +32,28 @@ def get_unprocessed_listings(db: Session, limit: int = 500, offset: int = 0):
             models.Listings.title,
             models.Listings.website
         )
-        .filter(
-            (models.Listings.processed_at.is_(None)) #|
-           # (models.Listings.needs_review.is_(True))
-        )
-        .offset(offset)
+        .where(models.Listings.processed_at.is_(None))
+        .order_by(models.Listings.ad_id)
         .limit(limit)
-        .all()
     )
-    return rows
+    yield from stream_partitions(db, stmt, chunk)
 
 
+def stream_partitions(db: Session, stmt, chunk: int = 1000) -> Iterator[List]:
+    """
+    Run a SELECT through a server-side cursor and yield its rows `chunk` at a time.
+    The cursor runs on its own connection so the caller can commit on `db` between
+    chunks without closing it.
+    """
+    with db.get_bind().connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk).execute(stmt)
+        for rows in result.partitions():
+            yield rows
+
 # ----------------------
 # Update listing after matching
 # ----------------------
-def update_listing_with_match(
+def stage_listing_update(
     db: Session,
     ad_id: str,
     normalized_trim: str = None,
@@ -42,7 +61,9 @@ def update_listing_with_match(
     method: str = "unmatched"
 ):
     """
-    Updates a listing with the matched trim information and logs history.
+    Applies the matched trim to a listing and adds its history row, without committing.
+    The caller owns the transaction: commit once per batch, or for a single listing
+    wrap the call in `with db.begin():`.
     Ensures that normalized_trim and new_trim are never None.
     """
     listing = db.query(models.Listings).filter(models.Listings.ad_id == ad_id).first()
@@ -55,11 +76,12 @@ def update_listing_with_match(
     # Set new trim safely
     safe_trim = normalized_trim or listing.trim or "unmatched"
 
+    now = utcnow()
     listing.normalized_trim = safe_trim
     listing.trim_confidence = confidence
     listing.assignment_method = method
     listing.needs_review = (method == "unmatched")
-    listing.processed_at = datetime.utcnow()
+    listing.processed_at = now
 
     # Record history
     history = models.TrimHistory(
@@ -67,13 +89,41 @@ def update_listing_with_match(
         old_trim=old_trim,
         new_trim=safe_trim,
         changed_by="system_match",
-        changed_at=datetime.utcnow()
+        changed_at=now
     )
     db.add(history)
+    return listing
+
+
+def update_listing_with_match(
+    db: Session,
+    ad_id: str,
+    normalized_trim: str = None,
+    confidence: float = 0.0,
+    method: str = "unmatched"
+):
+    """
+    Deprecated: commits once per listing. Use stage_listing_update and commit per batch.
+    """
+    warnings.warn(
+        "update_listing_with_match commits per row; use stage_listing_update",
+        DeprecationWarning,
+        stacklevel=2
+    )
+    listing = stage_listing_update(db, ad_id, normalized_trim, confidence, method)
     db.commit()
     return listing
 
 
+def relax_commit_durability(db: Session):
+    """
+    SET LOCAL synchronous_commit = off for the current transaction only.
+    For re-runnable batch work: a crash can lose the last few commits, but those
+    listings keep processed_at NULL and are simply matched again on the next run.
+    """
+    db.execute(text("SET LOCAL synchronous_commit = off"))
+
+
 # ----------------------
 # Optional helper: bulk update
 # ----------------------
@@ -81,12 +131,65 @@ def bulk_update_listings(db: Session, updates: list[dict]):
     """
     Accepts a list of updates like:
     [{"ad_id": "123", "normalized_trim": "SE", "confidence": 0.9, "method": "exact"}, ...]
+    Preloads the listings in one query, then stages all listing updates and
+    history rows as two executemany statements. Does not commit; the caller does.
     """
+    if not updates:
+        return 0
+
+    # Collapse repeated ad_ids (last write wins) so history old_trim is never stale
+    latest = {}
     for update in updates:
-        update_listing_with_match(
-            db,
-            ad_id=update["ad_id"],
-            normalized_trim=update.get("normalized_trim"),
-            confidence=update.get("confidence", 0.0),
-            method=update.get("method", "unmatched")
-        )
+        latest[update["ad_id"]] = update
+
+    ad_ids = list(latest)
+    existing = {
+        row.ad_id: row
+        for row in db.query(
+            models.Listings.ad_id,
+            models.Listings.trim,
+            models.Listings.normalized_trim
+        ).filter(models.Listings.ad_id.in_(ad_ids)).all()
+    }
+
+    now = utcnow()
+    update_rows = []
+    history_rows = []
+    for update in latest.values():
+        listing = existing.get(update["ad_id"])
+        if not listing:
+            continue
+
+        method = update.get("method", "unmatched")
+        old_trim = listing.normalized_trim or listing.trim or "unmatched"
+        safe_trim = update.get("normalized_trim") or listing.trim or "unmatched"
+
+        update_rows.append({
+            "ad_id": listing.ad_id,
+            "normalized_trim": safe_trim,
+            "trim_confidence": update.get("confidence", 0.0),
+            "assignment_method": method,
+            "needs_review": (method == "unmatched"),
+            "processed_at": now,
+        })
+        history_rows.append({
+            "listing_id": listing.ad_id,
+            "old_trim": old_trim,
+            "new_trim": safe_trim,
+            "changed_by": "system_match",
+            "changed_at": now,
+        })
+
+    db.bulk_update_mappings(models.Listings, update_rows)
+    insert_history_rows(db, history_rows)
+    return len(update_rows)
+
+
+def insert_history_rows(db: Session, rows: list[dict]):
+    """
+    Append TrimHistory rows with a Core INSERT executemany on the session's connection:
+    no ORM instances or unit-of-work bookkeeping, and the engine folds it into
+    multi-row VALUES pages.
+    """
+    if rows:
+        db.execute(insert(models.TrimHistory.__table__), rows)
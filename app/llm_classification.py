@@ -1,13 +1,19 @@
 from __future__ import annotations
-import json
+import asyncio
 import os
 import time
 import logging
-import requests
-from typing import Dict, List, Optional
+import threading
+import httpx
+import orjson
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from .normalization import norm as _norm, clip01 as _clip01
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 # --------- network settings (tune for your infra) ----------
 LLM_API_URL = "https://api.perplexity.ai/chat/completions"
 LLM_MODEL = "sonar"
@@ -17,86 +23,148 @@ BACKOFF_BASE = 0.75             # seconds, exponential backoff base
 RATE_LIMIT_QPS = 1.3            # soft rate limit for bulk jobs
 
 # lightweight token bucket
-_last_ts = 0.0
-def _rate_limit():
-    global _last_ts
-    if RATE_LIMIT_QPS <= 0:
-        return
-    min_interval = 1.0 / RATE_LIMIT_QPS
-    now = time.monotonic()
-    wait = min_interval - (now - _last_ts)
-    if wait > 0:
-        time.sleep(wait)
-    _last_ts = time.monotonic()
-
-def _extract_json(text: str) -> Optional[dict]:
-    """
-    Robustly pull a JSON object from a model response that might include prose or code fences.
+_NANO = 1_000_000_000           # one token, in nano-token units
+
+class TokenBucket:
+    """
+    Token bucket on the monotonic nanosecond clock.
+    Tokens are held as integer nano-tokens so repeated refills never drift.
+    The lock only guards the refill/take arithmetic, so the same bucket can be
+    shared by threads (acquire) and event loops (acquire_async).
+    """
+    __slots__ = ("capacity", "rate", "tokens", "last_ns", "lock")
+
+    def __init__(self, capacity: int, rate: float):
+        self.capacity = capacity * _NANO
+        self.rate = rate                # tokens per second
+        self.tokens = self.capacity
+        self.last_ns = time.monotonic_ns()
+        self.lock = threading.Lock()
+
+    def _take(self) -> int:
+        """
+        Refill, then take one token. Returns 0 on success, else nanoseconds until one is available.
+        """
+        with self.lock:
+            now = time.monotonic_ns()
+            refill = int((now - self.last_ns) * self.rate)
+            self.tokens = min(self.capacity, self.tokens + refill)
+            self.last_ns = now
+            if self.tokens >= _NANO:
+                self.tokens -= _NANO
+                return 0
+            return int((_NANO - self.tokens) / self.rate) + 1
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            wait_ns = self._take()
+            if not wait_ns:
+                return
+            time.sleep(wait_ns / _NANO)
+
+    async def acquire_async(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            wait_ns = self._take()
+            if not wait_ns:
+                return
+            await asyncio.sleep(wait_ns / _NANO)
+
+# small capacity: a large burst just trips the server-side limiter
+LLM_BURST = 3
+_LLM_BUCKET = TokenBucket(capacity=LLM_BURST, rate=RATE_LIMIT_QPS)
+
+# requests in flight at once for fan-out callers; more than the bucket's burst would
+# only queue on the bucket while holding a connection
+LLM_CONCURRENCY = min(LLM_BURST, 32)
+
+def _extract_json(text) -> Optional[object]:
+    """
+    Parse a model response as JSON. With response_format set the content is plain JSON
+    and parses on the first try; the fence / bracket fallbacks only cover a model that
+    still wraps it in prose or code fences.
     """
     if not text:
         return None
 
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        pass
+
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", "replace")
+
     # Strip code fences if present
     if "```" in text:
         # take the largest JSON-looking chunk between fences
         chunks = text.split("```")
         for ch in chunks:
             ch = ch.strip()
-            if ch.startswith("{") and ch.endswith("}"):
+            if (ch.startswith("{") and ch.endswith("}")) or (ch.startswith("[") and ch.endswith("]")):
                 try:
-                    return json.loads(ch)
-                except Exception:
+                    return orjson.loads(ch)
+                except orjson.JSONDecodeError:
                     pass
 
-    # Fallback: grab from first '{' to the matching last '}'
-    try:
-        first = text.find("{")
-        last = text.rfind("}")
+    # Fallback: grab from first '{' to the matching last '}' (or '[' / ']' for a bare
+    # array), trying whichever bracket opens first
+    pairs = sorted(
+        (("{", "}"), ("[", "]")),
+        key=lambda p: text.find(p[0]) if text.find(p[0]) != -1 else len(text)
+    )
+    for open_ch, close_ch in pairs:
+        first = text.find(open_ch)
+        last = text.rfind(close_ch)
         if first != -1 and last != -1 and last > first:
-            candidate = text[first:last+1]
-            return json.loads(candidate)
-    except Exception:
-        pass
+            try:
+                return orjson.loads(text[first:last+1])
+            except orjson.JSONDecodeError:
+                pass
 
-    # Final attempt: direct parse
-    try:
-        return json.loads(text)
-    except Exception:
-        return None
+    return None
 
-def _norm(s: Optional[str]) -> str:
-    import re
-    if not s:
-        return ""
-    s = s.lower()
-    s = re.sub(r"[^a-z0-9]+", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+_UNMATCHED: Dict[str, object] = {"trim": "", "confidence": 0.0, "assignment_method": "unmatched"}
 
-def _clip01(x: float) -> float:
-    try:
-        return max(0.0, min(1.0, float(x)))
-    except Exception:
-        return 0.0
+# Structured output: the API constrains the reply to these schemas, so content is bare JSON
+_CHOICE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "trim": {"type": "string"},
+        "confidence": {"type": "number"},
+        "assignment_method": {"type": "string"},
+    },
+    "required": ["trim", "confidence"],
+}
+_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "idx": {"type": "integer"},
+                    "trim": {"type": "string"},
+                    "confidence": {"type": "number"},
+                },
+                "required": ["idx", "trim", "confidence"],
+            },
+        },
+    },
+    "required": ["results"],
+}
 
-def llm_assign(
-    listing,
-    candidate_trims: List[str],
-    *,
-    min_ai_confidence: float = 0.55
-) -> Dict[str, object]:
-    """
-    Use Perplexity to map a listing to a canonical trim.
-    Returns: {trim: <string or ''>, confidence: [0,1], assignment_method: 'LLM'}
-    - Validates trim against candidate list (case-insensitive).
-    - Rate-limited, retried with exponential backoff.
-    """
+def _response_format(schema: dict) -> dict:
+    return {"type": "json_schema", "json_schema": {"schema": schema}}
 
-    api_key = os.environ.get("PERP_API_KEY") or os.environ.get("PERPLEXITY_API_KEY")
-    if not api_key:
-        logger.warning("PERP_API_KEY not set; skipping LLM.")
-        return {"trim": "", "confidence": 0.0, "assignment_method": "unmatched"}
+def _api_key() -> Optional[str]:
+    return os.environ.get("PERP_API_KEY") or os.environ.get("PERPLEXITY_API_KEY")
 
+def _build_payload(listing, candidate_trims: List[str]) -> dict:
     # Build prompt safely (truncate long fields)
     title = (getattr(listing, "title", None) or "")[:180]
     desc = (getattr(listing, "description", None) or "")[:1000]  # keep prompt bounded
@@ -137,62 +205,85 @@ RESPONSE (STRICT JSON):
 }}
 """.strip()
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    payload = {
+    return {
         "model": LLM_MODEL,
         "messages": [{"role": "user", "content": prompt}],
         "max_tokens": 250,
         "temperature": 0.2,
         "top_p": 0.9,
+        "response_format": _response_format(_CHOICE_SCHEMA),
+    }
+
+def _headers(api_key: str) -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
     }
 
-    # Prepare a case-insensitive validator
-    norm_map = { _norm(t): t for t in candidate_trims if t }
-    norm_keys = set(norm_map.keys())
+def _check_response(resp: httpx.Response) -> None:
+    if resp.status_code >= 500:
+        raise httpx.HTTPError(f"Server {resp.status_code}")
+    resp.raise_for_status()
+
+def _parse_choice(data: dict, candidate_trims: List[str], min_ai_confidence: float) -> Dict[str, object]:
+    """
+    Validate the model's choice against the candidate list (case-insensitive).
+    Raises ValueError when the response carries no JSON object, so the caller retries.
+    """
+    content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
+    parsed = _extract_json(content)
+
+    if not parsed:
+        raise ValueError("LLM response did not contain valid JSON.")
+    # a bare array/number/string parses fine but is not an answer; retry it like bad JSON
+    if not isinstance(parsed, dict):
+        raise ValueError("LLM response was not a JSON object.")
+
+    raw_trim_out = parsed.get("trim") or ""
+    conf_out = _clip01(parsed.get("confidence", 0.0))
+
+    # Validate & normalize the model's choice
+    if raw_trim_out:
+        norm_map = { _norm(t): t for t in candidate_trims if t }
+        chosen_norm = _norm(raw_trim_out)
+        if chosen_norm in norm_map and conf_out >= min_ai_confidence:
+            return {
+                "trim": norm_map[chosen_norm],
+                "confidence": conf_out,
+                "assignment_method": "LLM",
+            }
+    # Either empty, not in candidates or too low confidence
+    return dict(_UNMATCHED)
+
+# Shared keep-alive client: one TLS session (HTTP/2 multiplexed) reused across calls
+_HTTP = httpx.Client(
+    http2=True,
+    timeout=REQUEST_TIMEOUT,
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+)
+
+def _call_with_retries(payload: dict, parse: Callable[[dict], T]) -> Optional[T]:
+    """
+    POST payload, parse the response; rate-limited, retried with exponential backoff.
+    Returns None when the key is missing or all attempts fail.
+    """
+    api_key = _api_key()
+    if not api_key:
+        logger.warning("PERP_API_KEY not set; skipping LLM.")
+        return None
+
+    headers = _headers(api_key)
 
     # Retry loop with backoff
     last_exc = None
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            _rate_limit()
-            resp = requests.post(
-                LLM_API_URL,
-                headers=headers,
-                json=payload,
-                timeout=REQUEST_TIMEOUT,
-            )
-            if resp.status_code >= 500:
-                raise requests.HTTPError(f"Server {resp.status_code}")
-            resp.raise_for_status()
-            data = resp.json()
-            content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-            parsed = _extract_json(content)
-
-            if not parsed:
-                raise ValueError("LLM response did not contain valid JSON.")
-
-            raw_trim_out = parsed.get("trim") or ""
-            conf_out = _clip01(parsed.get("confidence", 0.0))
-
-            # Validate & normalize the model's choice
-            if raw_trim_out:
-                chosen_norm = _norm(raw_trim_out)
-                if chosen_norm in norm_keys and conf_out >= min_ai_confidence:
-                    return {
-                        "trim": norm_map[chosen_norm],
-                        "confidence": conf_out,
-                        "assignment_method": "LLM",
-                    }
-                else:
-                    # Either not in candidates or too low confidence
-                    return {"trim": "", "confidence": 0.0, "assignment_method": "unmatched"}
-            else:
-                return {"trim": "", "confidence": 0.0, "assignment_method": "unmatched"}
-
-        except (requests.Timeout, requests.ConnectionError, requests.HTTPError, ValueError) as e:
+            _LLM_BUCKET.acquire()
+            resp = _HTTP.post(LLM_API_URL, headers=headers, content=orjson.dumps(payload))
+            _check_response(resp)
+            return parse(orjson.loads(resp.content))
+
+        except (httpx.HTTPError, ValueError) as e:
             last_exc = e
             sleep_s = BACKOFF_BASE * (2 ** (attempt - 1))
             logger.warning("LLM call failed (attempt %d/%d): %s; backing off %.2fs",
@@ -201,7 +292,249 @@ RESPONSE (STRICT JSON):
         except Exception as e:
             # Unexpected; don't keep retrying forever
             logger.exception("Unexpected LLM error: %s", e)
-            return {"trim": "", "confidence": 0.0, "assignment_method": "unmatched"}
+            return None
+
+    logger.error("LLM failed after %d attempts: %s", MAX_RETRIES, last_exc)
+    return None
+
+async def _acall_with_retries(
+    http: httpx.AsyncClient,
+    payload: dict,
+    parse: Callable[[dict], T]
+) -> Optional[T]:
+    """
+    Async twin of _call_with_retries.
+    """
+    api_key = _api_key()
+    if not api_key:
+        logger.warning("PERP_API_KEY not set; skipping LLM.")
+        return None
+
+    headers = _headers(api_key)
+
+    last_exc = None
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            await _LLM_BUCKET.acquire_async()
+            resp = await http.post(LLM_API_URL, headers=headers, content=orjson.dumps(payload))
+            _check_response(resp)
+            return parse(orjson.loads(resp.content))
+
+        except (httpx.HTTPError, ValueError) as e:
+            last_exc = e
+            sleep_s = BACKOFF_BASE * (2 ** (attempt - 1))
+            logger.warning("LLM call failed (attempt %d/%d): %s; backing off %.2fs",
+                           attempt, MAX_RETRIES, e, sleep_s)
+            await asyncio.sleep(sleep_s)
+        except Exception as e:
+            logger.exception("Unexpected LLM error: %s", e)
+            return None
 
     logger.error("LLM failed after %d attempts: %s", MAX_RETRIES, last_exc)
-    return {"trim": "", "confidence": 0.0, "assignment_method": "unmatched"}
+    return None
+
+def llm_assign(
+    listing,
+    candidate_trims: List[str],
+    *,
+    min_ai_confidence: float = 0.55
+) -> Dict[str, object]:
+    """
+    Use Perplexity to map a listing to a canonical trim.
+    Returns: {trim: <string or ''>, confidence: [0,1], assignment_method: 'LLM'}
+    - Validates trim against candidate list (case-insensitive).
+    - Rate-limited, retried with exponential backoff.
+    """
+    payload = _build_payload(listing, candidate_trims)
+    result = _call_with_retries(
+        payload, lambda data: _parse_choice(data, candidate_trims, min_ai_confidence)
+    )
+    return result or dict(_UNMATCHED)
+
+def new_async_client() -> httpx.AsyncClient:
+    """
+    AsyncClient with the same settings as the shared sync client.
+    Async clients are bound to one event loop, so callers own its lifetime.
+    """
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=REQUEST_TIMEOUT,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+    )
+
+async def llm_assign_async(
+    listing,
+    candidate_trims: List[str],
+    *,
+    min_ai_confidence: float = 0.55,
+    http: Optional[httpx.AsyncClient] = None
+) -> Dict[str, object]:
+    """
+    Async twin of llm_assign for fan-out with asyncio.gather.
+    Pass a shared AsyncClient (see new_async_client) to reuse connections across tasks.
+    """
+    if http is None:
+        async with new_async_client() as client:
+            return await llm_assign_async(
+                listing, candidate_trims, min_ai_confidence=min_ai_confidence, http=client
+            )
+
+    payload = _build_payload(listing, candidate_trims)
+    result = await _acall_with_retries(
+        http, payload, lambda data: _parse_choice(data, candidate_trims, min_ai_confidence)
+    )
+    return result or dict(_UNMATCHED)
+
+# ---------------------------
+# Batched prompts: K listings sharing one candidate list per request
+# ---------------------------
+
+LLM_BATCH_SIZE = 20
+
+def _build_batch_payload(listings: List, candidate_trims: List[str]) -> dict:
+    # Numbered candidates once for the whole batch; listing fields truncated harder than
+    # the single-listing prompt so K descriptions still fit
+    lines = []
+    for i, t in enumerate(candidate_trims[:300], start=1):
+        lines.append(f"{i}. {t}")
+
+    brand = getattr(listings[0], "brand", "") or ""
+    model = getattr(listings[0], "model", "") or ""
+
+    items = []
+    for idx, listing in enumerate(listings, start=1):
+        title = (getattr(listing, "title", None) or "")[:180]
+        desc = (getattr(listing, "description", None) or "")[:300]
+        raw_trim = getattr(listing, "trim", "") or ""
+        items.append(f'{idx}. Title: {title} | Raw Trim: "{raw_trim}" | Description: {desc}')
+
+    prompt = f"""
+You are an expert automotive analyst specializing in GCC market vehicle trim identification. For EACH listing below, map the raw trim to the best canonical trim from the list. Choose ONLY from the list; do not invent names.
+
+VEHICLE:
+- Make: {brand}
+- Model: {model}
+
+LISTINGS:
+{chr(10).join(items)}
+
+CANDIDATE TRIMS:
+{chr(10).join(lines)}
+
+RULES:
+1) For each listing pick exactly one from the list above (or empty if no acceptable match).
+2) Prefer precise matches (engine, drivetrain, edition) over superficial keywords.
+3) If uncertain between close options, choose the more common/base trim.
+4) If confidence < 0.40, return empty trim.
+5) Never return "Other/Unknown/Generic".
+6) Return one result per listing, using the listing number as idx.
+
+RESPONSE (STRICT JSON):
+{{
+  "results": [
+    {{"idx": 1, "trim": "<exact candidate from list or empty string>", "confidence": <0.0 to 1.0>}}
+  ]
+}}
+""".strip()
+
+    return {
+        "model": LLM_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": 100 + 60 * len(listings),
+        "temperature": 0.2,
+        "top_p": 0.9,
+        "response_format": _response_format(_BATCH_SCHEMA),
+    }
+
+def _parse_batch(data: dict, n: int) -> List[Dict[str, object]]:
+    """
+    Map {"results": [{idx, trim, confidence}, ...]} (or a bare array) back onto n listings.
+    Returns the model's raw choices; listings it skipped come back unmatched.
+    """
+    content = data.get("choices", [{}])[0].get("message", {}).get("content", "")
+    parsed = _extract_json(content)
+    entries = parsed.get("results") if isinstance(parsed, dict) else parsed
+    if not isinstance(entries, list):
+        raise ValueError("LLM batch response did not contain a results array.")
+
+    out = [dict(_UNMATCHED) for _ in range(n)]
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            idx = int(entry.get("idx")) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= idx < n and entry.get("trim"):
+            out[idx] = {
+                "trim": str(entry["trim"]),
+                "confidence": _clip01(entry.get("confidence", 0.0)),
+                "assignment_method": "LLM",
+            }
+    return out
+
+def llm_assign_batch(
+    listings: List,
+    candidate_trims: List[str],
+    *,
+    batch_size: int = LLM_BATCH_SIZE
+) -> List[Dict[str, object]]:
+    """
+    Ask for trims for many listings that share one candidate list (same brand/model).
+    Sends one request per batch_size listings; returns results in input order.
+    Unlike llm_assign, choices are NOT validated here: callers check them against
+    their own candidate map and confidence floor (see matching._llm_accept).
+    """
+    out: List[Dict[str, object]] = []
+    for start in range(0, len(listings), batch_size):
+        chunk = listings[start:start + batch_size]
+        payload = _build_batch_payload(chunk, candidate_trims)
+        result = _call_with_retries(payload, lambda data: _parse_batch(data, len(chunk)))
+        out.extend(result or [dict(_UNMATCHED) for _ in chunk])
+    return out
+
+async def llm_assign_batches_async(
+    work: List[Tuple[List, List[str]]],
+    *,
+    batch_size: int = LLM_BATCH_SIZE,
+    concurrency: int = LLM_CONCURRENCY
+) -> List[List[Dict[str, object]]]:
+    """
+    llm_assign_batch for many (listings, candidate_trims) groups at once.
+    Every batch_size prompt of every group is sent concurrently over one AsyncClient,
+    at most `concurrency` in flight and still paced by the shared token bucket,
+    so total latency is ~ceil(prompts / concurrency) round-trips instead of their sum.
+    Returns one result list per group, in input order; choices are not validated.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(http: httpx.AsyncClient, chunk: List, candidate_trims: List[str]):
+        async with sem:
+            payload = _build_batch_payload(chunk, candidate_trims)
+            result = await _acall_with_retries(
+                http, payload, lambda data: _parse_batch(data, len(chunk))
+            )
+        return result or [dict(_UNMATCHED) for _ in chunk]
+
+    async with new_async_client() as http:
+        tasks = []
+        for listings, candidate_trims in work:
+            chunks = [listings[i:i + batch_size] for i in range(0, len(listings), batch_size)]
+            tasks.append(asyncio.gather(*[one(http, c, candidate_trims) for c in chunks]))
+        grouped = await asyncio.gather(*tasks)
+
+    return [[r for chunk_results in group for r in chunk_results] for group in grouped]
+
+def llm_assign_batches(
+    work: List[Tuple[List, List[str]]],
+    *,
+    batch_size: int = LLM_BATCH_SIZE,
+    concurrency: int = LLM_CONCURRENCY
+) -> List[List[Dict[str, object]]]:
+    """
+    Blocking entry point for llm_assign_batches_async, for sync code (e.g. sync FastAPI
+    routes, which run in a worker thread with no event loop).
+    """
+    return asyncio.run(
+        llm_assign_batches_async(work, batch_size=batch_size, concurrency=concurrency)
+    )
@@ -1,3 +1,4 @@
+import os
 from fastapi import FastAPI
 from app import models
 from app.database import engine
@@ -11,7 +12,10 @@ origins = [
 
 
 
-models.Base.metadata.create_all(bind=engine)
+# Schema is managed by Alembic (`alembic upgrade head`); create_all is a dev-only
+# shortcut since it reflects every table on each worker boot
+if os.getenv("AUTO_CREATE_SCHEMA") == "1":
+    models.Base.metadata.create_all(bind=engine)
 
 app = FastAPI()
 
@@ -1,15 +1,21 @@
 from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Iterable, List, Dict, Optional, Tuple
+from typing import Callable, Iterable, List, Dict, Optional, Tuple, Union
 
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from rapidfuzz import process, fuzz
+import numpy as np
 import logging
-import re
+import os
+import threading
+import time
 
-from .llm_classification import llm_assign
+from .llm_classification import llm_assign, llm_assign_batches
+from .normalization import norm as _norm, compact as _compact, clip01 as _clip01
 
 logger = logging.getLogger(__name__)
 
@@ -17,23 +23,6 @@ logger = logging.getLogger(__name__)
 # Helper utilities
 # ---------------------------
 
-_WS_RE = re.compile(r"\s+")
-_ALNUM_RE = re.compile(r"[^a-z0-9]+")
-
-def _norm(s: Optional[str]) -> str:
-    if not s:
-        return ""
-    s = s.lower()
-    s = _ALNUM_RE.sub(" ", s)      # keep word boundaries
-    s = _WS_RE.sub(" ", s).strip()
-    return s
-
-def _clip01(x: float) -> float:
-    try:
-        return max(0.0, min(1.0, float(x)))
-    except Exception:
-        return 0.0
-
 def _canonical_method(name: Optional[str]) -> str:
     """
     Map any legacy/variant names into a small canonical set.
@@ -57,7 +46,7 @@ def _canonical_method(name: Optional[str]) -> str:
     # Default fallback
     return "fuzzy"
 
-@dataclass
+@dataclass(slots=True)
 class ListingInput:
     brand: str
     model: str
@@ -80,32 +69,60 @@ class ListingInput:
 # Candidate trims
 # ---------------------------
 
+CANDIDATE_CACHE_TTL = 300       # seconds
+CANDIDATE_CACHE_MAXSIZE = 10_000  # brand/model pairs kept before LRU eviction
+
+# (brand_key, model_key, limit) -> (fetched_at, trims), oldest use first
+_CANDIDATE_CACHE: "OrderedDict[Tuple[str, str, int], Tuple[float, List[str]]]" = OrderedDict()
+_CANDIDATE_CACHE_LOCK = threading.Lock()
+
+
+def clear_candidate_cache(brand: Optional[str] = None, model: Optional[str] = None) -> None:
+    """
+    Drop cached candidate lists: only the given brand/model's when both are passed,
+    otherwise all of them. Call after trim_master / trim_alias changes so the next
+    lookup sees them instead of waiting out the TTL.
+    """
+    with _CANDIDATE_CACHE_LOCK:
+        if brand is None or model is None:
+            _CANDIDATE_CACHE.clear()
+            return
+        group = candidate_key(brand, model)
+        for key in [k for k in _CANDIDATE_CACHE if k[:2] == group]:
+            del _CANDIDATE_CACHE[key]
+
+
 def get_candidate_trims(db: Session, brand: str, model: str, limit: int = 2000) -> List[str]:
     """
     Get all possible trims for a brand/model from trim_master + aliases.
     Deduplicates and returns original strings (not normalized).
+    Results are cached per normalized (brand, model) for CANDIDATE_CACHE_TTL seconds,
+    at most CANDIDATE_CACHE_MAXSIZE entries (least recently used evicted first).
     """
+    key = (_compact(brand), _compact(model), limit)
+    with _CANDIDATE_CACHE_LOCK:
+        cached = _CANDIDATE_CACHE.get(key)
+        if cached and time.monotonic() - cached[0] < CANDIDATE_CACHE_TTL:
+            _CANDIDATE_CACHE.move_to_end(key)
+            return list(cached[1])
+
+    # key[0]/key[1] are computed exactly like the generated make_norm/model_norm columns,
+    # so both branches are index seeks on ix_trim_master_norm; UNION ALL because we
+    # dedupe below anyway
     rows = db.execute(
-    text("""
-        SELECT trim_name
-        FROM trim_master
-        WHERE REGEXP_REPLACE(LOWER(make), '[^a-z0-9]', '', 'g')
-              = REGEXP_REPLACE(LOWER(:brand), '[^a-z0-9]', '', 'g')
-          AND REGEXP_REPLACE(LOWER(model), '[^a-z0-9]', '', 'g')
-              = REGEXP_REPLACE(LOWER(:model), '[^a-z0-9]', '', 'g')
-        UNION
-        SELECT alias
-        FROM trim_alias ta
-        JOIN trim_master tm ON ta.trim_master_id = tm.id
-        WHERE REGEXP_REPLACE(LOWER(tm.make), '[^a-z0-9]', '', 'g')
-              = REGEXP_REPLACE(LOWER(:brand), '[^a-z0-9]', '', 'g')
-          AND REGEXP_REPLACE(LOWER(tm.model), '[^a-z0-9]', '', 'g')
-              = REGEXP_REPLACE(LOWER(:model), '[^a-z0-9]', '', 'g')
-        LIMIT :limit
-    """),
-    {"brand": brand, "model": model, "limit": limit}
-).fetchall()
-
+        text("""
+            SELECT trim_name
+            FROM trim_master
+            WHERE make_norm = :brand AND model_norm = :model
+            UNION ALL
+            SELECT ta.alias
+            FROM trim_alias ta
+            JOIN trim_master tm ON ta.trim_master_id = tm.id
+            WHERE tm.make_norm = :brand AND tm.model_norm = :model
+            LIMIT :limit
+        """),
+        {"brand": key[0], "model": key[1], "limit": limit}
+    ).fetchall()
 
     # Deduplicate while preserving input order
     seen = set()
@@ -118,95 +135,238 @@ def get_candidate_trims(db: Session, brand: str, model: str, limit: int = 2000)
             continue
         seen.add(t.lower())
         out.append(t)
+
+    with _CANDIDATE_CACHE_LOCK:
+        _CANDIDATE_CACHE[key] = (time.monotonic(), out)
+        _CANDIDATE_CACHE.move_to_end(key)
+        while len(_CANDIDATE_CACHE) > CANDIDATE_CACHE_MAXSIZE:
+            _CANDIDATE_CACHE.popitem(last=False)
+    return list(out)
+
+def resolve_exact(db: Session, brand: str, model: str, raw_trim: Optional[str]) -> Optional[str]:
+    """
+    Resolve a raw trim to its canonical trim_name entirely in SQL, or None.
+    Compares the generated *_norm columns (lowercase, non-alphanumerics removed) through
+    ix_trim_master_norm / ix_trim_alias_master_norm, so no candidate list is fetched.
+    """
+    trim_key = _compact(raw_trim)
+    if not trim_key:
+        return None
+
+    row = db.execute(
+        text("""
+            SELECT trim_name
+            FROM trim_master
+            WHERE make_norm = :brand AND model_norm = :model AND trim_norm = :trim
+            UNION ALL
+            SELECT tm.trim_name
+            FROM trim_alias ta
+            JOIN trim_master tm ON ta.trim_master_id = tm.id
+            WHERE tm.make_norm = :brand AND tm.model_norm = :model AND ta.alias_norm = :trim
+            LIMIT 1
+        """),
+        {"brand": _compact(brand), "model": _compact(model), "trim": trim_key}
+    ).first()
+    return row[0] if row else None
+
+def get_candidate_trims_topk(
+    db: Session, brand: str, model: str, raw_trim: Optional[str], k: int = 25,
+    min_similarity: float = 0.0
+) -> List[str]:
+    """
+    The k trims/aliases of a brand/model closest to raw_trim by trigram distance (pg_trgm),
+    nearest first, deduplicated. Lets callers run rapidfuzz over k strings instead of the
+    whole candidate list. Falls back to get_candidate_trims when raw_trim is empty.
+    min_similarity additionally drops candidates below that trigram similarity; keep it at
+    0 where abbreviations matter ("ltd" shares almost no trigrams with "limited").
+    """
+    trim_key = _compact(raw_trim)
+    if not trim_key:
+        return get_candidate_trims(db, brand, model)[:k]
+
+    rows = db.execute(
+        text("""
+            SELECT name FROM (
+                (SELECT trim_name AS name, trim_norm <-> :trim AS dist
+                 FROM trim_master
+                 WHERE make_norm = :brand AND model_norm = :model
+                   AND trim_norm <-> :trim <= :max_dist
+                 ORDER BY dist
+                 LIMIT :k)
+                UNION ALL
+                (SELECT ta.alias AS name, ta.alias_norm <-> :trim AS dist
+                 FROM trim_alias ta
+                 JOIN trim_master tm ON ta.trim_master_id = tm.id
+                 WHERE tm.make_norm = :brand AND tm.model_norm = :model
+                   AND ta.alias_norm <-> :trim <= :max_dist
+                 ORDER BY dist
+                 LIMIT :k)
+            ) nearest
+            ORDER BY dist
+            LIMIT :k
+        """),
+        {
+            "brand": _compact(brand), "model": _compact(model), "trim": trim_key, "k": k,
+            # distance is 1 - similarity; <= 1 keeps everything
+            "max_dist": 1.0 - min_similarity,
+        }
+    ).fetchall()
+
+    seen = set()
+    out: List[str] = []
+    for r in rows:
+        t = (r[0] or "").strip()
+        if t and t.lower() not in seen:
+            seen.add(t.lower())
+            out.append(t)
     return out
 
 # ---------------------------
 # Matching core
 # ---------------------------
 
-def match_trim(
-    listing,
-    candidate_trims: Iterable[str],
-    *,
-    fuzzy_primary_threshold: int = 82,       # robust token_set primary threshold
-    fuzzy_secondary_threshold: int = 74,     # allow slightly lower with combined fields
-    min_ai_confidence: float = 0.55,
-    allow_external_llm: bool = True
-) -> Dict[str, object]:
+_UNMATCHED: Dict[str, object] = {"trim": None, "confidence": 0.0, "assignment_method": "unmatched"}
+
+def candidate_key(brand: Optional[str], model: Optional[str]) -> Tuple[str, str]:
     """
-    Robust matching pipeline:
-      1) Exact (normalized)
-      2) Fuzzy on trim
-      3) Fuzzy on title/description + trim combined (token_set/partial mix)
-      4) LLM (optional)
-      5) Unmatched
-    Returns: {trim, confidence, assignment_method}
+    Grouping key for listings that share a candidate list (same form as the cache key).
     """
-    li = ListingInput.from_obj(listing)
+    return _compact(brand), _compact(model)
 
-    # Prepare candidate maps
-    cand_list = [c for c in (candidate_trims or []) if c]
-    if not cand_list:
-        return {"trim": None, "confidence": 0.0, "assignment_method": "unmatched"}
+@dataclass(frozen=True)
+class PreparedCandidates:
+    """
+    A candidate list normalized once, reusable across every listing of a (brand, model).
+    """
+    originals: List[str]                 # non-empty candidates, as given (sent to the LLM)
+    norm_to_original: Dict[str, str]     # normalized -> original, for O(1) exact lookups
+    normalized: List[str]                # unique normalized candidates, in input order
 
+def prepare_candidates(candidate_trims) -> PreparedCandidates:
+    """
+    Normalize a candidate list once. Passing a PreparedCandidates returns it unchanged.
+    """
+    if isinstance(candidate_trims, PreparedCandidates):
+        return candidate_trims
+    originals = [c for c in (candidate_trims or []) if c]
     norm_to_original: Dict[str, str] = {}
-    normalized_candidates: List[str] = []
-    for t in cand_list:
+    normalized: List[str] = []
+    for t in originals:
         n = _norm(t)
         if n and n not in norm_to_original:
             norm_to_original[n] = t
-            normalized_candidates.append(n)
+            normalized.append(n)
+    return PreparedCandidates(originals, norm_to_original, normalized)
 
-    raw_trim_norm = _norm(li.trim)
+def _has_context(li: ListingInput) -> bool:
+    """
+    Whether the title or description carry anything the combined/LLM stages could use.
+    """
+    return bool(_norm(li.title) or _norm(li.description))
 
-    # 1) Exact (normalized)
-    if raw_trim_norm and raw_trim_norm in norm_to_original:
-        return {
-            "trim": norm_to_original[raw_trim_norm],
-            "confidence": 1.0,
-            "assignment_method": "exact",
-        }
+def _best_by_scorer(query: str, scorer, candidates: List[str]) -> Tuple[Optional[str], int]:
+    """
+    Choose best fuzzy candidate by scorer.
+    """
+    if not query:
+        return None, 0
+    res = process.extractOne(query, candidates, scorer=scorer)  # (match, score, idx)
+    if not res:
+        return None, 0
+    return res[0], int(res[1])
+
+def _llm_accept(
+    ai_guess: Dict[str, object],
+    norm_to_original: Dict[str, str],
+    min_ai_confidence: float
+) -> Optional[Dict[str, object]]:
+    ai_trim = ai_guess.get("trim") or ""
+    ai_conf = _clip01(ai_guess.get("confidence", 0.0))
+    ai_method = _canonical_method(ai_guess.get("assignment_method", "LLM"))
+
+    # Only accept if the chosen trim is actually in candidate list (case-insensitive)
+    logger.debug("AI inferred: %s", ai_trim)
+    if ai_trim:
+        chosen_norm = _norm(ai_trim)
+        if chosen_norm in norm_to_original and ai_conf >= min_ai_confidence:
+            return {
+                "trim": norm_to_original[chosen_norm],
+                "confidence": ai_conf,
+                "assignment_method": ai_method,
+            }
+    return None
 
-    if allow_external_llm:
-        try:
-            ai_guess = llm_assign(li, cand_list, min_ai_confidence=min_ai_confidence)
-            ai_trim = ai_guess.get("trim") or ""
-            ai_conf = _clip01(ai_guess.get("confidence", 0.0))
-            ai_method = _canonical_method(ai_guess.get("assignment_method", "LLM"))
-
-            # Only accept if the chosen trim is actually in candidate list (case-insensitive)
-            print(f"AI inferred: {ai_trim}")
-            if ai_trim:
-                chosen_norm = _norm(ai_trim)
-                if chosen_norm in norm_to_original and ai_conf >= min_ai_confidence:
-                    return {
-                        "trim": norm_to_original[chosen_norm],
-                        "confidence": ai_conf,
-                        "assignment_method": ai_method,
-                    }
-        except Exception as e:
-            logger.exception("LLM assignment failed: %s", e)
-
-
-    # Helper to choose best fuzzy candidate by scorer
-    def _best_by_scorer(query: str, scorer, candidates: List[str]) -> Tuple[Optional[str], int]:
-        if not query:
-            return None, 0
-        res = process.extractOne(query, candidates, scorer=scorer)  # (match, score, idx)
-        if not res:
-            return None, 0
-        return res[0], int(res[1])
+LLM_CACHE_MAXSIZE = 10_000  # accepted LLM answers kept before LRU eviction
 
-    # 2) Fuzzy on the trim alone (token_set_ratio is generally robust to word order)
-    best_val, best_score = _best_by_scorer(raw_trim_norm, fuzz.token_set_ratio, normalized_candidates)
-    if best_val and best_score >= fuzzy_primary_threshold:
-        return {
-            "trim": norm_to_original[best_val],
-            "confidence": _clip01(best_score / 100.0),
-            "assignment_method": "fuzzy",
-        }
+# (brand_key, model_key, candidates fingerprint, min confidence, trim, title, description)
+#   -> accepted result, oldest use first. Only accepted answers are kept: a rejection
+# cannot be told apart from a failed call, and those should be retried next run.
+_LLM_CACHE: "OrderedDict[tuple, Dict[str, object]]" = OrderedDict()
+_LLM_CACHE_LOCK = threading.Lock()
 
-    # 3) Fuzzy using combined evidence (trim + title + description)
+def _llm_cache_key(li: ListingInput, cand_fingerprint: int, min_ai_confidence: float) -> tuple:
+    """
+    Listings that would send the LLM the same evidence against the same candidates
+    share a key; cand_fingerprint is hash(tuple(cand_list)), so catalog edits miss.
+    """
+    return (
+        candidate_key(li.brand, li.model) + (cand_fingerprint, min_ai_confidence)
+        + (_norm(li.trim), _norm(li.title), _norm(li.description))
+    )
+
+def _llm_cache_get(key: tuple) -> Optional[Dict[str, object]]:
+    with _LLM_CACHE_LOCK:
+        cached = _LLM_CACHE.get(key)
+        if cached is None:
+            return None
+        _LLM_CACHE.move_to_end(key)
+        return dict(cached)
+
+def _llm_cache_put(key: tuple, result: Dict[str, object]) -> None:
+    with _LLM_CACHE_LOCK:
+        _LLM_CACHE[key] = dict(result)
+        _LLM_CACHE.move_to_end(key)
+        while len(_LLM_CACHE) > LLM_CACHE_MAXSIZE:
+            _LLM_CACHE.popitem(last=False)
+
+def _llm_pick(
+    li: ListingInput,
+    cand_list: List[str],
+    norm_to_original: Dict[str, str],
+    min_ai_confidence: float
+) -> Optional[Dict[str, object]]:
+    try:
+        ai_guess = llm_assign(li, cand_list, min_ai_confidence=min_ai_confidence)
+        return _llm_accept(ai_guess, norm_to_original, min_ai_confidence)
+    except Exception as e:
+        logger.exception("LLM assignment failed: %s", e)
+    return None
+
+def _llm_pick_batches(
+    work: List[Tuple[List[ListingInput], List[str], Dict[str, str]]],
+    min_ai_confidence: float
+) -> List[List[Optional[Dict[str, object]]]]:
+    """
+    _llm_pick for many groups, each (listings, cand_list, norm_to_original): one prompt per
+    LLM_BATCH_SIZE listings of a group, all groups' prompts in flight concurrently.
+    """
+    try:
+        ai_guesses = llm_assign_batches([(lis, cand_list) for lis, cand_list, _ in work])
+        return [
+            [_llm_accept(g, norm_to_original, min_ai_confidence) for g in guesses]
+            for (_, _, norm_to_original), guesses in zip(work, ai_guesses)
+        ]
+    except Exception as e:
+        logger.exception("LLM batch assignment failed: %s", e)
+    return [[None] * len(lis) for lis, _, _ in work]
+
+def _fuzzy_combined(
+    li: ListingInput,
+    raw_trim_norm: str,
+    normalized_candidates: List[str],
+    norm_to_original: Dict[str, str],
+    fuzzy_secondary_threshold: int
+) -> Optional[Dict[str, object]]:
     # Build a combined query to capture extra clues
     title_norm = _norm(li.title)
     desc_norm = _norm(li.description)
@@ -248,8 +408,260 @@ def match_trim(
                 "confidence": _clip01(cand_score / 100.0),
                 "assignment_method": "fuzzy",
             }
+    return None
+
+def match_trim(
+    listing,
+    candidate_trims: Union[Iterable[str], PreparedCandidates],
+    *,
+    fuzzy_primary_threshold: int = 82,       # robust token_set primary threshold
+    fuzzy_secondary_threshold: int = 74,     # allow slightly lower with combined fields
+    min_ai_confidence: float = 0.55,
+    allow_external_llm: bool = True
+) -> Dict[str, object]:
+    """
+    Robust matching pipeline:
+      1) Exact (normalized)
+      2) Fuzzy on trim
+      3) Fuzzy on title/description + trim combined (token_set/partial mix)
+      4) LLM (optional, only if we still don't have a solid fuzzy)
+      5) Unmatched
+    candidate_trims may be a PreparedCandidates so callers matching many listings
+    against the same list normalize it only once.
+    Returns: {trim, confidence, assignment_method}
+    """
+    li = ListingInput.from_obj(listing)
+
+    # Prepare candidate maps
+    prepared = prepare_candidates(candidate_trims)
+    if not prepared.originals:
+        return dict(_UNMATCHED)
+
+    cand_list = prepared.originals
+    norm_to_original, normalized_candidates = prepared.norm_to_original, prepared.normalized
+
+    raw_trim_norm = _norm(li.trim)
+
+    # Nothing to match on: skip fuzzy scoring and the LLM call entirely
+    if not raw_trim_norm and not _has_context(li):
+        return dict(_UNMATCHED)
 
-    # 4) LLM (optional and only if we still don't have a solid fuzzy)
+    # 1) Exact (normalized)
+    if raw_trim_norm and raw_trim_norm in norm_to_original:
+        return {
+            "trim": norm_to_original[raw_trim_norm],
+            "confidence": 1.0,
+            "assignment_method": "exact",
+        }
+
+    # 2) Fuzzy on the trim alone (token_set_ratio is generally robust to word order)
+    best_val, best_score = _best_by_scorer(raw_trim_norm, fuzz.token_set_ratio, normalized_candidates)
+    if best_val and best_score >= fuzzy_primary_threshold:
+        return {
+            "trim": norm_to_original[best_val],
+            "confidence": _clip01(best_score / 100.0),
+            "assignment_method": "fuzzy",
+        }
+
+    # 3) Fuzzy using combined evidence (trim + title + description)
+    combined_result = _fuzzy_combined(
+        li, raw_trim_norm, normalized_candidates, norm_to_original, fuzzy_secondary_threshold
+    )
+    if combined_result:
+        return combined_result
+
+    # 4) LLM (answers for identical evidence are reused)
+    if allow_external_llm:
+        key = _llm_cache_key(li, hash(tuple(cand_list)), min_ai_confidence)
+        ai_result = _llm_cache_get(key)
+        if ai_result is None:
+            ai_result = _llm_pick(li, cand_list, norm_to_original, min_ai_confidence)
+            if ai_result:
+                _llm_cache_put(key, ai_result)
+        if ai_result:
+            return ai_result
+
+    # 5) No match
+    return dict(_UNMATCHED)
+
+def _score_group(
+    inputs: List[ListingInput],
+    idxs: List[int],
+    prepared: PreparedCandidates,
+    fuzzy_primary_threshold: int,
+    cdist_workers: int,
+) -> Tuple[Dict[int, Dict[str, object]], List[Tuple[int, str]]]:
+    """
+    Exact and fuzzy-on-trim stages for the rows `idxs` of one (brand, model) group.
+    Returns ({row index: result}, [(row index, normalized trim)] left for the combined
+    stage). Reads only trims and touches no shared state, so groups can run on
+    separate threads and descriptions can be loaded afterwards for the leftovers only.
+    """
+    results: Dict[int, Dict[str, object]] = {}
+    norm_to_original, normalized_candidates = prepared.norm_to_original, prepared.normalized
+
+    # 1) Exact (normalized); everything else goes through the scored stages
+    pending: List[Tuple[int, str]] = []
+    no_trim: List[Tuple[int, str]] = []
+    for i in idxs:
+        raw_trim_norm = _norm(inputs[i].trim)
+        if not raw_trim_norm:
+            # blank trim: only title/description can place it
+            no_trim.append((i, ""))
+        elif raw_trim_norm in norm_to_original:
+            results[i] = {
+                "trim": norm_to_original[raw_trim_norm],
+                "confidence": 1.0,
+                "assignment_method": "exact",
+            }
+        else:
+            pending.append((i, raw_trim_norm))
+
+    # 2) Fuzzy on trim for the whole group in one C++ call (GIL released).
+    # Both sides are already _norm'ed (candidates once per group, raw trims once per
+    # listing above), so no processor runs inside cdist. Blank trims are left out.
+    deferred: List[Tuple[int, str]] = []
+    if pending:
+        scores = process.cdist(
+            [q for _, q in pending],
+            normalized_candidates,
+            scorer=fuzz.token_set_ratio,
+            processor=None,
+            dtype=np.float32,
+            workers=cdist_workers,
+        )
+        best_cols = scores.argmax(axis=1)
+        for row, (i, raw_trim_norm) in enumerate(pending):
+            best_score = int(scores[row, best_cols[row]])
+            if best_score >= fuzzy_primary_threshold:
+                results[i] = {
+                    "trim": norm_to_original[normalized_candidates[best_cols[row]]],
+                    "confidence": _clip01(best_score / 100.0),
+                    "assignment_method": "fuzzy",
+                }
+            else:
+                deferred.append((i, raw_trim_norm))
+
+    return results, deferred + no_trim
+
+def match_trim_batch(
+    listings: List,
+    candidate_trims_by_key: Dict[Tuple[str, str], Union[List[str], PreparedCandidates]],
+    *,
+    fuzzy_primary_threshold: int = 82,
+    fuzzy_secondary_threshold: int = 74,
+    min_ai_confidence: float = 0.55,
+    allow_external_llm: bool = True,
+    describe: Optional[Callable[[List[int]], List[Optional[str]]]] = None
+) -> List[Dict[str, object]]:
+    """
+    Same pipeline as match_trim for many listings at once.
+    Listings are grouped by candidate_key(brand, model); candidates are normalized once
+    per group (or not at all when the caller passes PreparedCandidates), and the
+    fuzzy-on-trim stage for a group is one process.cdist call. Groups are scored on a
+    thread pool (cdist releases the GIL). Rows still unmatched after fuzzy go to the LLM
+    in batched prompts, with the prompts of every group sent concurrently.
+    describe, if given, is called once with the indexes of the rows exact/fuzzy-on-trim
+    could not place and returns their descriptions (same order), so callers only load
+    descriptions for rows that get as far as the combined stage.
+    Returns results in input order.
+    """
+    results: List[Optional[Dict[str, object]]] = [None] * len(listings)
+
+    groups: Dict[Tuple[str, str], List[int]] = {}
+    inputs = [ListingInput.from_obj(l) for l in listings]
+    for i, li in enumerate(inputs):
+        groups.setdefault(candidate_key(li.brand, li.model), []).append(i)
+
+    work: List[Tuple[List[int], PreparedCandidates]] = []
+    for key, idxs in groups.items():
+        prepared = prepare_candidates(candidate_trims_by_key.get(key))
+        if not prepared.originals:
+            for i in idxs:
+                results[i] = dict(_UNMATCHED)
+        else:
+            work.append((idxs, prepared))
+
+    # One group: let cdist spread its rows over all cores. Many groups: one group per
+    # thread, each cdist single-threaded, so small groups don't each pay a thread fan-out.
+    def run(item, cdist_workers):
+        idxs, prepared = item
+        return _score_group(inputs, idxs, prepared, fuzzy_primary_threshold, cdist_workers)
+
+    if len(work) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(work), os.cpu_count() or 1)) as pool:
+            group_outcomes = list(pool.map(lambda item: run(item, 1), work))
+    else:
+        group_outcomes = [run(item, -1) for item in work]
+
+    if describe is not None:
+        needed = [i for _, deferred in group_outcomes for i, _ in deferred]
+        if needed:
+            for i, description in zip(needed, describe(needed)):
+                inputs[i].description = description
+
+    # (row indexes left unmatched after fuzzy, cand_list, norm_to_original) per group
+    llm_groups: List[Tuple[List[int], List[str], Dict[str, str]]] = []
+    for (_, prepared), (group_results, deferred) in zip(work, group_outcomes):
+        for i, r in group_results.items():
+            results[i] = r
+
+        unmatched: List[int] = []
+        for i, raw_trim_norm in deferred:
+            if not raw_trim_norm and not _has_context(inputs[i]):
+                # nothing for the combined stage or the LLM to work with
+                results[i] = dict(_UNMATCHED)
+                continue
+
+            # 3) Combined evidence, only for rows the primary stage could not place
+            results[i] = _fuzzy_combined(
+                inputs[i], raw_trim_norm, prepared.normalized, prepared.norm_to_original,
+                fuzzy_secondary_threshold
+            )
+            if results[i] is None:
+                unmatched.append(i)
+
+        if unmatched:
+            llm_groups.append((unmatched, prepared.originals, prepared.norm_to_original))
+
+    # 4) LLM for what fuzzy left over: batched prompts per group, all groups concurrently.
+    # Rows with the same evidence are asked once, and answers cached by earlier calls
+    # are not asked at all.
+    ai_results: List[List[Optional[Dict[str, object]]]] = [[None] * len(u) for u, _, _ in llm_groups]
+    if allow_external_llm and llm_groups:
+        known: Dict[tuple, Optional[Dict[str, object]]] = {}
+        group_keys: List[List[tuple]] = []
+        work, work_keys = [], []
+        for unmatched, cand_list, norm_to_original in llm_groups:
+            fingerprint = hash(tuple(cand_list))
+            keys = [_llm_cache_key(inputs[i], fingerprint, min_ai_confidence) for i in unmatched]
+            group_keys.append(keys)
+            ask_rows, ask_keys = [], []
+            for i, key in zip(unmatched, keys):
+                if key in known:
+                    continue
+                known[key] = _llm_cache_get(key)
+                if known[key] is None:
+                    ask_rows.append(inputs[i])
+                    ask_keys.append(key)
+            if ask_rows:
+                work.append((ask_rows, cand_list, norm_to_original))
+                work_keys.append(ask_keys)
+
+        if work:
+            for keys, answers in zip(work_keys, _llm_pick_batches(work, min_ai_confidence)):
+                for key, answer in zip(keys, answers):
+                    known[key] = answer
+                    if answer:
+                        _llm_cache_put(key, answer)
+
+        ai_results = [
+            [dict(known[key]) if known[key] else None for key in keys] for keys in group_keys
+        ]
 
     # 5) No match
-    return {"trim": None, "confidence": 0.0, "assignment_method": "unmatched"}
+    for (unmatched, _, _), group_results in zip(llm_groups, ai_results):
+        for i, ai_result in zip(unmatched, group_results):
+            results[i] = ai_result or dict(_UNMATCHED)
+
+    return results
@@ -1,8 +1,32 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, Float, TIMESTAMP, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Boolean, Float, TIMESTAMP, ForeignKey, Index, UniqueConstraint, Computed, DDL, event, text, func
+from sqlalchemy.orm import relationship
 from .database import Base
 
+# the trigram indexes below need the extension (migrations create it in 0005)
+event.listen(
+    Base.metadata, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+
+def _norm_expr(col: str) -> Computed:
+    # same key as matching._compact: lowercase, every non-alphanumeric removed
+    return Computed(f"regexp_replace(lower({col}), '[^a-z0-9]', '', 'g')", persisted=True)
+
 class TrimMaster(Base):
     __tablename__ = "trim_master"
+    __table_args__ = (
+        # exact-trim resolution and per (make, model) candidate lookups seek on this
+        Index("ix_trim_master_norm", "make_norm", "model_norm", "trim_norm"),
+        # add_trim's duplicate check; leading (make, model) serves the plain pair too
+        Index("ix_trim_master_make_model_trim", "make", "model", "trim_name"),
+        # /aliases filters on lower(make) [and lower(model)]
+        Index("ix_trim_master_make_model_lower", func.lower(text("make")), func.lower(text("model"))),
+        # trigram KNN (ORDER BY trim_norm <-> :q) for get_candidate_trims_topk
+        Index(
+            "ix_trim_master_trim_norm_trgm", "trim_norm",
+            postgresql_using="gist", postgresql_ops={"trim_norm": "gist_trgm_ops"},
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     make = Column(String, nullable=False)
@@ -11,17 +35,50 @@ class TrimMaster(Base):
     year_start = Column(Integer, nullable=True)
     year_end = Column(Integer, nullable=True)
     created_at = Column(TIMESTAMP)
+    make_norm = Column(String, _norm_expr("make"))
+    model_norm = Column(String, _norm_expr("model"))
+    trim_norm = Column(String, _norm_expr("trim_name"))
 
 class TrimAlias(Base):
     __tablename__ = "trim_alias"
+    __table_args__ = (
+        UniqueConstraint("trim_master_id", "alias", name="uq_trim_alias"),
+        # also serves plain trim_master_id lookups/joins (leading column)
+        Index("ix_trim_alias_master_norm", "trim_master_id", "alias_norm"),
+        Index(
+            "ix_trim_alias_alias_norm_trgm", "alias_norm",
+            postgresql_using="gist", postgresql_ops={"alias_norm": "gist_trgm_ops"},
+        ),
+    )
+    # INSERT ... RETURNING id, created_at, so new aliases need no refresh SELECT
+    __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True, index=True)
     trim_master_id = Column(Integer, ForeignKey("trim_master.id"), nullable=False)
     alias = Column(String, nullable=False)
-    created_at = Column(TIMESTAMP)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    alias_norm = Column(String, _norm_expr("alias"))
+
+    # selectin: one IN query for all parents instead of a lazy SELECT per alias
+    trim_master = relationship("TrimMaster", lazy="selectin")
 
 class Listings(Base):
     __tablename__ = "listings"
+    __table_args__ = (
+        # Serves the unprocessed queue scan (keyset on ad_id) without touching processed rows
+        Index(
+            "ix_listings_unprocessed", "ad_id",
+            postgresql_where=text("processed_at IS NULL OR needs_review IS TRUE"),
+        ),
+        Index("ix_listings_brand_model", "brand", "model"),
+        # /listings/processed filters on lower(brand) [and lower(model)]
+        Index("ix_listings_brand_model_lower", func.lower(text("brand")), func.lower(text("model"))),
+        # /listings/processed: method + confidence range over processed rows only
+        Index(
+            "ix_listings_processed_method_conf", "assignment_method", "trim_confidence",
+            postgresql_where=text("processed_at IS NOT NULL"),
+        ),
+    )
 
     ad_id = Column(String, primary_key=True, index=True)
     title = Column(String)
@@ -30,7 +87,6 @@ class Listings(Base):
     year = Column(Integer)
     website = Column(String)
     trim = Column(String)
-    website = Column(String)
     normalized_trim = Column(String)
     trim_confidence = Column(Float)
     assignment_method = Column(String)
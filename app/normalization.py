@@ -0,0 +1,37 @@
+from typing import Optional
+import re
+
+# ---------------------------
+# Text normalization shared by matching and the LLM client
+# ---------------------------
+
+# Latin-1 folding table: anything outside [a-z0-9] becomes a space
+_NON_ALNUM_TABLE = str.maketrans({
+    chr(c): " " for c in range(256)
+    if not ("a" <= chr(c) <= "z" or "0" <= chr(c) <= "9")
+})
+_NON_ASCII_RE = re.compile(r"[^\x00-\x7f]")
+
+def norm(s: Optional[str]) -> str:
+    """
+    Lowercase, every non-alphanumeric run collapsed to a single space.
+    """
+    if not s:
+        return ""
+    s = s.lower().translate(_NON_ALNUM_TABLE)
+    if not s.isascii():
+        # characters past Latin-1 are not in the table
+        s = _NON_ASCII_RE.sub(" ", s)
+    return " ".join(s.split())
+
+def compact(s: Optional[str]) -> str:
+    """
+    Same key as the SQL side: lowercase with every non-alphanumeric removed.
+    """
+    return norm(s).replace(" ", "")
+
+def clip01(x: float) -> float:
+    try:
+        return max(0.0, min(1.0, float(x)))
+    except Exception:
+        return 0.0
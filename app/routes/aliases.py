@@ -1,8 +1,11 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
 from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 from app.database import SessionLocal
 from app import models, schemas
+from app.matching import clear_candidate_cache
 
 router = APIRouter()
 
@@ -19,6 +22,7 @@ def list_aliases(
     model: Optional[str] = Query(None),
     db: Session = Depends(get_db)
 ):
+    # one projected JOIN: plain rows, no ORM instances for aliases or their trims
     query = db.query(
         models.TrimAlias.id,
         models.TrimAlias.trim_master_id,
@@ -27,16 +31,17 @@ def list_aliases(
         models.TrimMaster.make,
         models.TrimMaster.model,
         models.TrimMaster.trim_name,
-    ).join(models.TrimMaster)
+    ).join(models.TrimAlias.trim_master)
 
+    # case-insensitive equality (what ILIKE without wildcards did), served by
+    # ix_trim_master_make_model_lower
     if make:
-        query = query.filter(models.TrimMaster.make.ilike(make))
+        query = query.filter(func.lower(models.TrimMaster.make) == make.lower())
     if model:
-        query = query.filter(models.TrimMaster.model.ilike(model))
+        query = query.filter(func.lower(models.TrimMaster.model) == model.lower())
 
     aliases = query.all()
 
-    # Convert tuples to dict for Pydantic model
     result = [
         schemas.Alias(
             id=row.id,
@@ -54,26 +59,42 @@ def list_aliases(
 
 @router.post("/aliases", response_model=schemas.Alias)
 def add_alias(alias_in: schemas.AliasCreate, db: Session = Depends(get_db)):   # ✅ FIXED
-    trim = db.query(models.TrimMaster).filter(models.TrimMaster.id == alias_in.trim_master_id).first()
-    if not trim:
-        raise HTTPException(status_code=404, detail="TrimMaster not found")
+    alias_text = alias_in.alias.lower()
 
-    existing = db.query(models.TrimAlias).filter(
-        models.TrimAlias.trim_master_id == alias_in.trim_master_id,
-        models.TrimAlias.alias == alias_in.alias.lower()
+    # trim lookup and duplicate check in a single round-trip
+    alias_exists = (
+        select(models.TrimAlias.id)
+        .where(
+            models.TrimAlias.trim_master_id == models.TrimMaster.id,
+            models.TrimAlias.alias == alias_text
+        )
+        .exists()
+    )
+    row = db.execute(
+        select(models.TrimMaster, alias_exists)
+        .where(models.TrimMaster.id == alias_in.trim_master_id)
     ).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="TrimMaster not found")
+
+    trim, existing = row
     if existing:
         raise HTTPException(status_code=400, detail="Alias already exists for this trim")
 
     alias_obj = models.TrimAlias(
         trim_master_id=alias_in.trim_master_id,
-        alias=alias_in.alias.lower()
+        alias=alias_text,
+        trim_master=trim
     )
     db.add(alias_obj)
-    db.commit()
-    db.refresh(alias_obj)
-
-    return schemas.Alias(
+    # flush fetches id/created_at via RETURNING; read them before commit expires the object
+    try:
+        db.flush()
+    except IntegrityError:
+        # lost a race with a concurrent insert of the same alias (uq_trim_alias)
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Alias already exists for this trim")
+    response = schemas.Alias(
         id=alias_obj.id,
         trim_master_id=alias_obj.trim_master_id,
         alias=alias_obj.alias,
@@ -82,6 +103,10 @@ def add_alias(alias_in: schemas.AliasCreate, db: Session = Depends(get_db)):   #
         model=trim.model,
         trim_name=trim.trim_name
     )
+    db.commit()
+    clear_candidate_cache(response.make, response.model)
+
+    return response
 
 @router.delete("/aliases/{alias_id}")
 def delete_alias(alias_id: int, db: Session = Depends(get_db)):   # ✅ FIXED
@@ -89,6 +114,9 @@ def delete_alias(alias_id: int, db: Session = Depends(get_db)):   # ✅ FIXED
     if not alias:
         raise HTTPException(status_code=404, detail="Alias not found")
 
+    # trim_master is selectin-loaded with the alias; read it before commit expires it
+    make, model = alias.trim_master.make, alias.trim_master.model
     db.delete(alias)
     db.commit()
+    clear_candidate_cache(make, model)
     return {"message": "Alias deleted successfully"}
@@ -1,16 +1,18 @@
 # app/routes/listings.py
 from sqlalchemy.orm import Session
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
-from typing import Optional, List
-from datetime import datetime
-from sqlalchemy import text, func, case
+from fastapi.responses import Response, StreamingResponse
+from typing import Dict, Optional, List, Tuple
+from sqlalchemy import select, text, func
+from rapidfuzz import process, fuzz, utils
 from app.database import SessionLocal
 from app import models, db_utils, matching
-from collections import Counter
-
-
-import asyncio
-import httpx
+from collections import Counter, defaultdict
+from itertools import chain, groupby, islice
+import heapq
+import orjson
+import threading
+import time
 
 
 router = APIRouter()
@@ -34,25 +36,51 @@ WEBSITE_TABLE_MAP = {
     "opensooq": "opensooq_details",
 }
 
+# Listing + its website's details row in one round-trip: every details table is
+# LEFT JOINed but only the one matching the listing's website can produce a row
+_FULL_LISTING_SQL = text(
+    """
+    SELECT l.ad_id, l.brand, l.model, l.year, l.trim, l.normalized_trim,
+           l.trim_confidence, l.assignment_method, l.needs_review,
+           l.processed_at, l.last_reviewed_at, l.website,
+           COALESCE({details}) AS details
+    FROM listings l
+    {joins}
+    WHERE l.ad_id = :lid
+    """.format(
+        details=", ".join(f"to_jsonb(d_{site})" for site in WEBSITE_TABLE_MAP),
+        joins="\n    ".join(
+            f"LEFT JOIN {table} d_{site} ON d_{site}.ad_id = l.ad_id AND lower(l.website) = '{site}'"
+            for site, table in WEBSITE_TABLE_MAP.items()
+        ),
+    )
+)
+
+def _orjson_response(content, headers: Optional[dict] = None) -> Response:
+    """
+    JSON-encode with orjson and skip FastAPI's jsonable_encoder pass; for the
+    endpoints returning many rows or nested dicts. Contents must be plain
+    dict/list/str/number/datetime values; non-str keys (e.g. a NULL method) become strings.
+    """
+    return Response(
+        orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS),
+        media_type="application/json",
+        headers=headers
+    )
+
+
 @router.get("/listings/{ad_id}/details")
 def get_full_listing(ad_id: str, db: Session = Depends(get_db)):
-    # 1. Fetch the listing
-    listing = db.query(models.Listings).filter(models.Listings.ad_id == ad_id).first()
+    # 1. Fetch the listing and its website-specific details
+    listing = db.execute(_FULL_LISTING_SQL, {"lid": ad_id}).first()
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
 
-    website = listing.website.lower()
+    website = (listing.website or "").lower()
     if website not in WEBSITE_TABLE_MAP:
         raise HTTPException(status_code=400, detail=f"No details table for website {website}")
 
-    details_table = WEBSITE_TABLE_MAP[website]
-
-    # 2. Fetch website-specific details
-    details = db.execute(
-    text(f"SELECT * FROM {details_table} WHERE ad_id = :lid"),
-    {"lid": ad_id}).mappings().first()
-
-    # 3. Combine base listing + details for frontend
+    # 2. Combine base listing + details for frontend
     listing_data = {
         "ad_id": listing.ad_id,
         "brand": listing.brand,
@@ -67,10 +95,33 @@ def get_full_listing(ad_id: str, db: Session = Depends(get_db)):
         "last_reviewed_at": listing.last_reviewed_at,
     }
 
-    return {
+    return _orjson_response({
         "listing": listing_data,
-        "details": dict(details) if details else {}
-    }
+        "details": listing.details or {}
+    })
+
+
+# built once per website instead of a new text() per chunk
+_DESCRIPTION_SQL = {
+    site: text(f"SELECT ad_id, description FROM {table} WHERE ad_id = ANY(:ids)")
+    for site, table in WEBSITE_TABLE_MAP.items()
+}
+
+def _fetch_descriptions(db: Session, rows) -> dict:
+    """
+    ad_id -> description for a chunk of (ad_id, ..., website) rows: one query per
+    website's details table instead of one per listing.
+    """
+    ids_by_site = defaultdict(list)
+    for row in rows:
+        ids_by_site[row.website.lower()].append(row.ad_id)
+
+    descriptions = {}
+    for site, ad_ids in ids_by_site.items():
+        descriptions.update(
+            db.execute(_DESCRIPTION_SQL[site], {"ids": ad_ids}).tuples().all()
+        )
+    return descriptions
 
 
 @router.post("/process-listings")
@@ -84,76 +135,77 @@ def process_listings(
     Limit: maximum number of unprocessed listings to process
     Batch_size: how many to commit at a time
     """
-    unprocessed = db_utils.get_unprocessed_listings(db, limit)
-
-    if not unprocessed:
-        return {"status": "ok", "message": "No unprocessed listings found"}
-
     stats_methods = Counter()
     stats_confidence = Counter()
     processed_count = 0
 
-    for listing in unprocessed:
-        ad_id, brand, model, year, trim, title, website = listing
-        candidate_trims = matching.get_candidate_trims(db, brand, model)
-
-        website = website.lower()
-        details_table = WEBSITE_TABLE_MAP[website]
-
-        #
-        details = db.execute(
-            text(f"SELECT * FROM {details_table} WHERE ad_id = :lid"),
-            {"lid": ad_id}
-        ).mappings().first()
-
-        description = details["description"] if details and "description" in details else None
-
-        # temporary object for matching
-        listing_obj = type("Obj", (object,), {
-            "title": title,
-            "trim": trim,
-            "brand": brand,
-            "model": model,
-            "description": description
-        })
-
-        match_result = matching.match_trim(
-            listing=listing_obj,
-            candidate_trims=candidate_trims,
+    # candidate trims are fetched and normalized once per (brand, model) for the whole run
+    candidate_trims_by_key = {}
+
+    # server-side cursor: one batch_size chunk in memory at a time
+    for batch in db_utils.iter_unprocessed_listings(db, chunk=batch_size, limit=limit):
+        listing_inputs = []
+        for ad_id, brand, model, year, trim, title, website in batch:
+            key = matching.candidate_key(brand, model)
+            if key not in candidate_trims_by_key:
+                candidate_trims_by_key[key] = matching.prepare_candidates(
+                    matching.get_candidate_trims(db, brand, model)
+                )
+
+            listing_inputs.append(matching.ListingInput(
+                brand=brand or "",
+                model=model or "",
+                trim=trim,
+                title=title,
+            ))
+
+        # descriptions are only read past exact/fuzzy-on-trim, so load just those rows'
+        def describe(idxs):
+            rows = [batch[i] for i in idxs]
+            descriptions = _fetch_descriptions(db, rows)
+            return [descriptions.get(row.ad_id) for row in rows]
+
+        # one cdist per (brand, model) group and one LLM prompt per group's leftovers
+        match_results = matching.match_trim_batch(
+            listing_inputs,
+            candidate_trims_by_key,
             allow_external_llm=True,
             fuzzy_primary_threshold=82,
             fuzzy_secondary_threshold=74,
             min_ai_confidence=0.55,
+            describe=describe,
         )
 
-        method = match_result.get("assignment_method", "unmatched")
-        stats_methods[method] += 1
-
-        conf = match_result.get("confidence", 0.0)
-        if conf >= 0.75:
-            stats_confidence["high"] += 1
-        elif conf >= 0.4:
-            stats_confidence["medium"] += 1
-        else:
-            stats_confidence["low"] += 1
-
-        # update listing & record history
-        db_utils.update_listing_with_match(
-            db=db,
-            ad_id=ad_id,
-            normalized_trim=match_result.get("trim"),
-            confidence=conf,
-            method=method
-        )
-
-        processed_count += 1
-
-        # Commit every batch_size
-        if processed_count % batch_size == 0:
-            db.commit()
+        updates = []
+        for listing, match_result in zip(batch, match_results):
+            method = match_result.get("assignment_method", "unmatched")
+            stats_methods[method] += 1
+
+            conf = match_result.get("confidence", 0.0)
+            if conf >= 0.75:
+                stats_confidence["high"] += 1
+            elif conf >= 0.4:
+                stats_confidence["medium"] += 1
+            else:
+                stats_confidence["low"] += 1
+
+            updates.append({
+                "ad_id": listing[0],
+                "normalized_trim": match_result.get("trim"),
+                "confidence": conf,
+                "method": method,
+            })
+
+        # update listings & record history: two executemany statements, one commit per chunk;
+        # the run is re-runnable (processed_at), so the commit need not wait for WAL fsync
+        db_utils.relax_commit_durability(db)
+        processed_count += db_utils.bulk_update_listings(db, updates)
+        db.commit()
+
+    if not processed_count:
+        return {"status": "ok", "message": "No unprocessed listings found"}
 
-    # Final commit
-    db.commit()
+    clear_stats_cache()
 
     return {
         "status": "ok",
@@ -161,95 +213,21 @@ def process_listings(
         "methods": dict(stats_methods),
         "confidence": dict(stats_confidence)
     }
-# # ----------------------
-# # Process unprocessed listings
-# # ----------------------
-# @router.post("/process-listings")
-# def process_listings(limit: int = 5, db: Session = Depends(get_db)):
-#     unprocessed = db_utils.get_unprocessed_listings(db, limit)
-
-#     processed_count = 0
-#     exact_matches = 0
-#     fuzzy_matches = 0
-#     llm_matches = 0
-#     unmatched = 0
-
-#     for listing in unprocessed:
-#         ad_id, brand, model, year, trim, title, website = listing
-#         candidate_trims = matching.get_candidate_trims(db, brand, model)
-
-#         website = website.lower()
-#         details_table = WEBSITE_TABLE_MAP[website]
-
-#     # 2. Fetch website-specific details
-#         details = db.execute(
-#         text(f"SELECT * FROM {details_table} WHERE ad_id = :lid"),
-#         {"lid": ad_id}).mappings().first()
-
-#         description = None
-#         if details and "description" in details:
-#             description = details['description']
-#             print("Description:", details["description"])
-#         else:
-#             print("No description column or no result")
-
-
-#         # temporary object for matching
-#         listing_obj = type("Obj", (object,), {
-#             "title": title,
-#             "trim": trim,  # provide .trim to matching.match_trim
-#             "brand": brand,
-#             "model": model,
-#             "description": description
-#         })
-
-
-
-#         match_result = matching.match_trim(
-#     listing=listing_obj,
-#     candidate_trims=candidate_trims,
-#     allow_external_llm=True,          # or False to run cheaper/faster passes
-#     fuzzy_primary_threshold=82,
-#     fuzzy_secondary_threshold=74,
-#     min_ai_confidence=0.55,
-# )
-
-#         method = match_result.get("assignment_method", "unmatched")
-#         if method == "exact":
-#             exact_matches += 1
-#         elif method == "fuzzy":
-#             fuzzy_matches += 1
-#         elif method == "LLM":
-#             llm_matches += 1
-#         else:
-#             unmatched += 1
-
-#         # update listing & record history
-#         db_utils.update_listing_with_match(
-#             db=db,
-#             ad_id=ad_id,
-#             normalized_trim=match_result.get("trim"),
-#             confidence=match_result.get("confidence", 0.0),
-#             method=method
-#         )
-
-#         processed_count += 1
-
-#     return {
-#         "processed": processed_count,
-#         "exact_matches": exact_matches,
-#         "fuzzy_matches": fuzzy_matches,
-#         "llm_matches": llm_matches,
-#         "unmatched": unmatched
-#     }
 
 
 # ----------------------
 # Get unprocessed listings
 # ----------------------
 @router.get("/listings/unprocessed")
-def get_unprocessed_listings(limit: int = Query(100, ge=1), db: Session = Depends(get_db)):
-    rows = db.query(
+def get_unprocessed_listings(
+    limit: int = Query(100, ge=1),
+    after_ad_id: Optional[str] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Keyset pagination: pass the last ad_id of the previous page as after_ad_id.
+    """
+    query = db.query(
         models.Listings.ad_id,
         models.Listings.brand,
         models.Listings.model,
@@ -258,16 +236,21 @@ def get_unprocessed_listings(limit: int = Query(100, ge=1), db: Session = Depend
     ).filter(
         (models.Listings.processed_at.is_(None)) |
         (models.Listings.needs_review.is_(True))
-    ).limit(limit).all()
-    return [
+    )
+    if after_ad_id is not None:
+        query = query.filter(models.Listings.ad_id > after_ad_id)
+    rows = query.order_by(models.Listings.ad_id).limit(limit).all()  # walks ix_listings_unprocessed, stops at limit
+    return _orjson_response([
         {"ad_id": r.ad_id, "brand": r.brand, "model": r.model, "year": r.year, "trim": r.trim}
         for r in rows
-    ]
+    ])
 
 
 # ----------------------
 # Get processed listings
 # ----------------------
+PROCESSED_STREAM_CHUNK = 500
+
 @router.get("/listings/processed")
 def get_processed_listings(
     brand: Optional[str] = Query(None),
@@ -278,31 +261,51 @@ def get_processed_listings(
     limit: int = Query(100, ge=1),
     db: Session = Depends(get_db)
 ):
-    q = db.query(models.Listings).filter(models.Listings.processed_at.isnot(None))
+    # plain column rows: no ORM instances or identity-map entries for a read-only list
+    stmt = select(
+        models.Listings.ad_id,
+        models.Listings.brand,
+        models.Listings.model,
+        models.Listings.year,
+        models.Listings.trim,
+        models.Listings.normalized_trim,
+        models.Listings.trim_confidence,
+        models.Listings.assignment_method,
+        models.Listings.needs_review,
+        models.Listings.processed_at
+    ).where(models.Listings.processed_at.isnot(None))
     if brand:
-        q = q.filter(models.Listings.brand.ilike(brand))
+        stmt = stmt.where(func.lower(models.Listings.brand) == brand.lower())
     if model_name:
-        q = q.filter(models.Listings.model.ilike(model_name))
+        stmt = stmt.where(func.lower(models.Listings.model) == model_name.lower())
     if method:
-        q = q.filter(models.Listings.assignment_method == method)
-    q = q.filter(models.Listings.trim_confidence >= min_conf, models.Listings.trim_confidence <= max_conf)
-
-    rows = q.all()
-    return [
-        {
-            "ad_id": r.ad_id,
-            "brand": r.brand,
-            "model": r.model,
-            "year": r.year,
-            "trim": r.trim,  # consistent key for frontend
-            "normalized_trim": r.normalized_trim,
-            "confidence": r.trim_confidence,
-            "method": r.assignment_method,
-            "needs_review": r.needs_review,
-            "processed_at": r.processed_at
-        }
-        for r in rows
-    ]
+        stmt = stmt.where(models.Listings.assignment_method == method)
+    stmt = stmt.where(models.Listings.trim_confidence >= min_conf, models.Listings.trim_confidence <= max_conf)
+
+    # Streamed as the same JSON array the endpoint always returned, one server-side
+    # cursor chunk at a time, so memory stays bounded however many rows match
+    def generate():
+        sep = b"["
+        for rows in db_utils.stream_partitions(db, stmt, chunk=PROCESSED_STREAM_CHUNK):
+            yield sep + b",".join(
+                orjson.dumps({
+                    "ad_id": r.ad_id,
+                    "brand": r.brand,
+                    "model": r.model,
+                    "year": r.year,
+                    "trim": r.trim,  # consistent key for frontend
+                    "normalized_trim": r.normalized_trim,
+                    "confidence": r.trim_confidence,
+                    "method": r.assignment_method,
+                    "needs_review": r.needs_review,
+                    "processed_at": r.processed_at
+                })
+                for r in rows
+            )
+            sep = b","
+        yield b"[]" if sep == b"[" else b"]"
+
+    return StreamingResponse(generate(), media_type="application/json")
 
 
 
@@ -325,16 +328,24 @@ def assign_trim_manual(
     - confidence
     - changed_by
     """
-    listing = db.query(models.Listings).filter(models.Listings.ad_id == ad_id).first()
-    if not listing:
+    now = db_utils.utcnow()
+    trim_master_id = payload.get("trim_master_id")
+
+    # listing and (optionally) its trim master in one round-trip
+    stmt = select(models.Listings).where(models.Listings.ad_id == ad_id)
+    if trim_master_id:
+        stmt = stmt.add_columns(models.TrimMaster.trim_name).outerjoin(
+            models.TrimMaster, models.TrimMaster.id == trim_master_id
+        )
+    row = db.execute(stmt).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Listing not found")
+    listing = row[0]
 
-    trim_master_id = payload.get("trim_master_id")
     if trim_master_id:
-        tm = db.query(models.TrimMaster).filter(models.TrimMaster.id == trim_master_id).first()
-        if not tm:
+        if row.trim_name is None:
             raise HTTPException(status_code=404, detail="Trim master not found")
-        normalized_trim = tm.trim_name
+        normalized_trim = row.trim_name
     else:
         normalized_trim = payload.get("normalized_trim")
 
@@ -348,7 +359,7 @@ def assign_trim_manual(
     listing.trim_confidence = confidence
     listing.assignment_method = "manual"
     listing.needs_review = False
-    listing.last_reviewed_at = datetime.utcnow()
+    listing.last_reviewed_at = now
 
     # Record history
     history = models.TrimHistory(
@@ -356,7 +367,7 @@ def assign_trim_manual(
         old_trim=old_trim,
         new_trim=normalized_trim,
         changed_by=changed_by,
-        changed_at=datetime.utcnow()
+        changed_at=now
     )
     db.add(history)
 
@@ -369,24 +380,30 @@ def assign_trim_manual(
 # ----------------------
 @router.post("/listings/{ad_id}/reprocess")
 def reprocess_listing(ad_id: str, db: Session = Depends(get_db)):
+    now = db_utils.utcnow()
     listing = db.query(models.Listings).filter(models.Listings.ad_id == ad_id).first()
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
 
-    candidate_trims = matching.get_candidate_trims(db, listing.brand, listing.model)
-    listing_obj = type("Obj", (object,), {
-        "trim": listing.trim,  # changed from raw_trim
-        "brand": listing.brand,
-        "model": listing.model
-    })
-    match_result = matching.match_trim(listing_obj, candidate_trims)
+    # most raw trims resolve exactly; only fetch candidates when they don't
+    exact_trim = matching.resolve_exact(db, listing.brand, listing.model, listing.trim)
+    if exact_trim:
+        match_result = {"trim": exact_trim, "confidence": 1.0, "assignment_method": "exact"}
+    else:
+        candidate_trims = matching.get_candidate_trims(db, listing.brand, listing.model)
+        listing_obj = matching.ListingInput(
+            brand=listing.brand or "",
+            model=listing.model or "",
+            trim=listing.trim,  # changed from raw_trim
+        )
+        match_result = matching.match_trim(listing_obj, candidate_trims)
 
     old_trim = listing.normalized_trim
     listing.normalized_trim = match_result.get("trim")
     listing.trim_confidence = match_result.get("confidence", 0.0)
     listing.assignment_method = match_result.get("assignment_method", "unmatched")
     listing.needs_review = (listing.assignment_method == "unmatched")
-    listing.processed_at = datetime.utcnow()
+    listing.processed_at = now
 
     # record history
     history = models.TrimHistory(
@@ -394,7 +411,7 @@ def reprocess_listing(ad_id: str, db: Session = Depends(get_db)):
         old_trim=old_trim,
         new_trim=match_result.get("trim"),
         changed_by="system_reprocess",
-        changed_at=datetime.utcnow()
+        changed_at=now
     )
     db.add(history)
 
@@ -405,24 +422,35 @@ def reprocess_listing(ad_id: str, db: Session = Depends(get_db)):
 # ----------------------
 # Get candidate trims for a listing (with scores)
 # ----------------------
+CANDIDATE_SCORE_CUTOFF = 40    # candidates scoring below this are not worth showing
+
 @router.get("/listings/{ad_id}/candidates")
 def get_listing_candidates(ad_id: str, top_n: int = 10, db: Session = Depends(get_db)):
     listing = db.query(models.Listings).filter(models.Listings.ad_id == ad_id).first()
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
 
-    candidate_trims = matching.get_candidate_trims(db, listing.brand, listing.model)
-    from rapidfuzz import process, fuzz
-    if not listing.trim or not candidate_trims:
+    if not listing.trim:
+        return {"candidates": []}
+
+    # pg_trgm narrows the list to the nearest few in SQL; rapidfuzz ranks only those
+    candidate_trims = matching.get_candidate_trims_topk(
+        db, listing.brand, listing.model, listing.trim, k=max(25, top_n)
+    )
+    if not candidate_trims:
         return {"candidates": []}
 
+    # score_cutoff lets rapidfuzz skip the full computation for candidates whose cheap
+    # upper bound already falls below it
     results = process.extract(
         listing.trim,
         candidate_trims,
-        scorer=fuzz.token_sort_ratio,
-        limit=top_n
+        scorer=fuzz.WRatio,
+        processor=utils.default_process,
+        limit=top_n,
+        score_cutoff=CANDIDATE_SCORE_CUTOFF
     )
-    return [{"trim": r[0], "score": r[1] / 100.0} for r in results]
+    return _orjson_response([{"trim": r[0], "score": r[1] / 100.0} for r in results])
 
 
 # ----------------------
@@ -434,7 +462,7 @@ def mark_reviewed(ad_id: str, changed_by: Optional[str] = Body(None), db: Sessio
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
     listing.needs_review = False
-    listing.last_reviewed_at = datetime.utcnow()
+    listing.last_reviewed_at = db_utils.utcnow()
     db.commit()
     return {"status": "ok", "ad_id": ad_id}
 
@@ -442,12 +470,53 @@ def mark_reviewed(ad_id: str, changed_by: Optional[str] = Body(None), db: Sessio
 # ----------------------
 # Stats endpoint
 # ----------------------
+def _summary_counts(db: Session):
+    # total / processed / needs_review in one scan via COUNT(*) FILTER (WHERE ...)
+    return db.query(
+        func.count().label("total"),
+        func.count().filter(models.Listings.processed_at.isnot(None)).label("processed"),
+        func.count().filter(models.Listings.needs_review.is_(True)).label("needs_review"),
+    ).one()
+
+
+STATS_CACHE_TTL = 30    # seconds; dashboard numbers tolerate this much staleness
+
+# endpoint name -> (computed_at, payload)
+_STATS_CACHE: Dict[str, Tuple[float, dict]] = {}
+_STATS_CACHE_LOCK = threading.Lock()
+
+def _cached_stats(name: str, compute) -> dict:
+    """
+    compute() at most once per STATS_CACHE_TTL seconds per endpoint; the full-table
+    aggregates are the same for every caller in between.
+    """
+    with _STATS_CACHE_LOCK:
+        cached = _STATS_CACHE.get(name)
+        if cached and time.monotonic() - cached[0] < STATS_CACHE_TTL:
+            return cached[1]
+    payload = compute()
+    with _STATS_CACHE_LOCK:
+        _STATS_CACHE[name] = (time.monotonic(), payload)
+    return payload
+
+def clear_stats_cache() -> None:
+    """
+    Drop cached stats; called after the batch endpoints so their effect shows at once.
+    """
+    with _STATS_CACHE_LOCK:
+        _STATS_CACHE.clear()
+
+_STATS_HEADERS = {"Cache-Control": f"max-age={STATS_CACHE_TTL}"}
+
+
 @router.get("/stats")
-def get_stats(db: Session = Depends(get_db)):
-    total = db.query(models.Listings).count()
-    processed = db.query(models.Listings).filter(models.Listings.processed_at.isnot(None)).count()
-    needs_review = db.query(models.Listings).filter(models.Listings.needs_review.is_(True)).count()
-    return {"total": total, "processed": processed, "needs_review": needs_review}
+def get_stats(response: Response, db: Session = Depends(get_db)):
+    def compute():
+        counts = _summary_counts(db)
+        return {"total": counts.total, "processed": counts.processed, "needs_review": counts.needs_review}
+
+    response.headers.update(_STATS_HEADERS)
+    return _cached_stats("stats", compute)
 
 
 
@@ -459,145 +528,60 @@ def get_stats(db: Session = Depends(get_db)):
 
 @router.get("/stats/detailed")
 def get_detailed_stats(db: Session = Depends(get_db)):
-    total = db.query(models.Listings).count()
-    processed = db.query(models.Listings).filter(models.Listings.processed_at.isnot(None)).count()
-    needs_review = db.query(models.Listings).filter(models.Listings.needs_review.is_(True)).count()
-
-    # Count by assignment_method
-    method_counts = (
-        db.query(
-            models.Listings.assignment_method,
-            func.count().label("count")
-        )
-        .group_by(models.Listings.assignment_method)
-        .all()
+    return _orjson_response(
+        _cached_stats("detailed", lambda: _detailed_stats(db)), headers=_STATS_HEADERS
     )
 
-    # Confidence distribution (low/med/high)
-    conf_buckets = (
-        db.query(
-            func.count(case((models.Listings.trim_confidence < 0.5, 1))).label("low_conf"),
-            func.count(case(((models.Listings.trim_confidence >= 0.5) & (models.Listings.trim_confidence < 0.8), 1))).label("medium_conf"),
-            func.count(case((models.Listings.trim_confidence >= 0.8, 1))).label("high_conf"),
-        )
-        .first()
-    )
 
-    # Average confidence overall
-    avg_conf = db.query(func.avg(models.Listings.trim_confidence)).scalar()
-
-    # Breakdown by brand (top 10)
-    brand_breakdown = (
-        db.query(
+def _detailed_stats(db: Session) -> dict:
+    # summary, confidence distribution (low/med/high) and average in one scan
+    summary = db.query(
+        func.count().label("total"),
+        func.count().filter(models.Listings.processed_at.isnot(None)).label("processed"),
+        func.count().filter(models.Listings.needs_review.is_(True)).label("needs_review"),
+        func.count().filter(models.Listings.trim_confidence < 0.5).label("low_conf"),
+        func.count().filter((models.Listings.trim_confidence >= 0.5) & (models.Listings.trim_confidence < 0.8)).label("medium_conf"),
+        func.count().filter(models.Listings.trim_confidence >= 0.8).label("high_conf"),
+        func.avg(models.Listings.trim_confidence).label("avg_conf"),
+    ).one()
+
+    # counts by assignment_method and by brand in one scan: GROUPING SETS emits one
+    # row per method and one per brand; grouping(brand) = 0 marks the brand rows
+    grouped = db.execute(
+        select(
+            models.Listings.assignment_method,
             models.Listings.brand,
-            func.count().label("count"),
+            func.grouping(models.Listings.brand).label("by_method"),
+            func.count().label("n"),
             func.avg(models.Listings.trim_confidence).label("avg_conf"),
-        )
-        .group_by(models.Listings.brand)
-        .order_by(func.count().desc())
-        .limit(10)
-        .all()
+        ).group_by(func.grouping_sets(models.Listings.assignment_method, models.Listings.brand))
+    ).all()
+    method_counts = [(r.assignment_method, r.n) for r in grouped if r.by_method]
+    # Breakdown by brand (top 10)
+    brand_breakdown = heapq.nlargest(
+        10, (r for r in grouped if not r.by_method), key=lambda r: r.n
     )
 
     return {
         "summary": {
-            "total": total,
-            "processed": processed,
-            "needs_review": needs_review,
-            "avg_confidence": round(avg_conf or 0, 3),
+            "total": summary.total,
+            "processed": summary.processed,
+            "needs_review": summary.needs_review,
+            "avg_confidence": round(summary.avg_conf or 0, 3),
         },
         "methods": {m: c for m, c in method_counts},
         "confidence": {
-            "low": conf_buckets.low_conf,
-            "medium": conf_buckets.medium_conf,
-            "high": conf_buckets.high_conf,
+            "low": summary.low_conf,
+            "medium": summary.medium_conf,
+            "high": summary.high_conf,
         },
         "brands_top10": [
-            {"brand": b, "count": c, "avg_conf": round(ac or 0, 3)}
-            for b, c, ac in brand_breakdown
+            {"brand": r.brand, "count": r.n, "avg_conf": round(r.avg_conf or 0, 3)}
+            for r in brand_breakdown
         ]
     }
 
 
-# async def process_listing(listing, db: Session):
-#     """Process a single listing using existing matching logic."""
-#     candidate_trims = matching.get_candidate_trims(db, listing.brand, listing.model)
-#     listing_obj = type("Obj", (object,), {
-#         "trim": listing.trim,
-#         "brand": listing.brand,
-#         "model": listing.model,
-#         "title": getattr(listing, "title", ""),
-#         "description": getattr(listing, "description", "")
-#     })
-#     # Use existing match_trim (sync), can still call async LLM internally if needed
-#     match_result = matching.match_trim(listing_obj, candidate_trims)
-
-#     old_trim = listing.normalized_trim
-
-#     listing.normalized_trim = match_result.get("trim")
-#     listing.trim_confidence = match_result.get("confidence", 0.0)
-#     listing.assignment_method = match_result.get("assignment_method", "unmatched")
-#     listing.needs_review = (listing.assignment_method == "unmatched")
-#     listing.processed_at = datetime.utcnow()
-
-#     history = models.TrimHistory(
-#         listing_id=listing.ad_id,
-#         old_trim=old_trim,
-#         new_trim=match_result.get("trim"),
-#         changed_by="system_bulk_reprocess_async",
-#         changed_at=datetime.utcnow()
-#     )
-#     db.add(history)
-
-#     return match_result
-
-# async def process_batch(batch, db: Session):
-#     """Process a batch of listings concurrently."""
-#     tasks = [asyncio.to_thread(process_listing, listing, db) for listing in batch]
-#     results = await asyncio.gather(*tasks)
-#     db.commit()  # commit once per batch
-#     return results
-
-# @router.post("/reprocess-processed-async")
-# async def reprocess_processed_async(
-#     db: Session = Depends(get_db),
-#     limit: int = Query(None, ge=1),
-#     batch_size: int = Query(50, ge=10)  # smaller batch_size for async safety
-# ):
-#     query = db.query(models.Listings).filter(models.Listings.processed_at.isnot(None))
-#     if limit:
-#         query = query.limit(limit)
-#     listings = query.all()
-#     if not listings:
-#         return {"status": "ok", "message": "No processed listings found"}
-
-#     stats_methods = Counter()
-#     stats_confidence = Counter()
-#     processed_count = 0
-
-#     # Split listings into batches
-#     for i in range(0, len(listings), batch_size):
-#         batch = listings[i:i+batch_size]
-#         results = await process_batch(batch, db)
-#         # Update stats
-#         for res, listing in zip(results, batch):
-#             stats_methods[listing.assignment_method] += 1
-#             conf = listing.trim_confidence
-#             if conf >= 0.75:
-#                 stats_confidence["high"] += 1
-#             elif conf >= 0.4:
-#                 stats_confidence["medium"] += 1
-#             else:
-#                 stats_confidence["low"] += 1
-#             processed_count += 1
-
-#     return {
-#         "status": "ok",
-#         "processed": processed_count,
-#         "methods": dict(stats_methods),
-#         "confidence": dict(stats_confidence)
-#     }
-
 @router.post("/reprocess-processed")
 def reprocess_processed(
     db: Session = Depends(get_db),
@@ -612,157 +596,117 @@ def reprocess_processed(
     Limit: maximum number of listings to reprocess
     Batch_size: how many to commit at a time
     """
-    query = db.query(models.Listings).filter(models.Listings.processed_at.isnot(None))
+    # plain column rows: nothing for the batch commits below to expire and reload
+    query = select(
+        models.Listings.ad_id,
+        models.Listings.brand,
+        models.Listings.model,
+        models.Listings.trim,
+        models.Listings.title,
+        models.Listings.normalized_trim
+    ).where(models.Listings.processed_at.isnot(None))
     if brand:
-        query = query.filter(models.Listings.brand.ilike(brand))
+        query = query.where(func.lower(models.Listings.brand) == brand.lower())
     if model:
-        query = query.filter(models.Listings.model.ilike(model))
-    if limit:
-        query = query.limit(limit)
+        query = query.where(func.lower(models.Listings.model) == model.lower())
+    # brand/model order keeps each candidate group contiguous for groupby below
+    query = query.order_by(models.Listings.brand, models.Listings.model).limit(limit)
 
-    listings = query.all()
-    if not listings:
-        return {"status": "ok", "message": "No processed listings found for the given filters"}
+    # streamed through a server-side cursor instead of materializing every row
+    listings = chain.from_iterable(db_utils.stream_partitions(db, query, chunk=batch_size))
 
     stats_methods = Counter()
     stats_confidence = Counter()
     processed_count = 0
 
-    for listing in listings:
-        candidate_trims = matching.get_candidate_trims(db, listing.brand, listing.model)
-        listing_obj = type("Obj", (object,), {
-            "trim": listing.trim,
-            "brand": listing.brand,
-            "model": listing.model,
-            "title": getattr(listing, "title", ""),
-            "description": getattr(listing, "description", "")
-        })
-        match_result = match_result = matching.match_trim(
-    listing=listing_obj,
-    candidate_trims=candidate_trims,
-    allow_external_llm=True,          # or False to run cheaper/faster passes
-    fuzzy_primary_threshold=82,
-    fuzzy_secondary_threshold=74,
-    min_ai_confidence=0.55,
-)
-
-        old_trim = listing.normalized_trim
-
-        listing.normalized_trim = match_result.get("trim")
-        listing.trim_confidence = match_result.get("confidence", 0.0)
-        listing.assignment_method = match_result.get("assignment_method", "unmatched")
-        listing.needs_review = (listing.assignment_method == "unmatched")
-        listing.processed_at = datetime.utcnow()
-
-        new_trim = match_result.get("trim") or ""
-
-        history = models.TrimHistory(
-            listing_id=listing.ad_id,
-            old_trim=old_trim,
-            new_trim=new_trim,
-            changed_by="system_bulk_reprocess",
-            changed_at=datetime.utcnow()
-        )
-        db.add(history)
-
-        stats_methods[listing.assignment_method] += 1
-        conf = listing.trim_confidence
-        if conf >= 0.75:
-            stats_confidence["high"] += 1
-        elif conf >= 0.4:
-            stats_confidence["medium"] += 1
-        else:
-            stats_confidence["low"] += 1
-
-        processed_count += 1
+    now = db_utils.utcnow()
+    update_rows = []
+    history_rows = []
+
+    def flush():
+        # one executemany UPDATE + one multi-row history INSERT per batch_size listings
+        db.bulk_update_mappings(models.Listings, update_rows)
+        db_utils.insert_history_rows(db, history_rows)
+        db.commit()
+        update_rows.clear()
+        history_rows.clear()
+
+    # candidates fetched and normalized once per (brand, model) group, not per listing;
+    # spellings that only differ in case/punctuation may form separate runs, which just
+    # hit the candidate cache
+    group_key = lambda l: matching.candidate_key(l.brand, l.model)
+    for key, group in groupby(listings, key=group_key):
+        candidate_trims = None
+        # a group is matched batch_size rows at a time, so a large (brand, model)
+        # group never sits in memory whole
+        while batch := list(islice(group, batch_size)):
+            if candidate_trims is None:
+                candidate_trims = matching.prepare_candidates(
+                    matching.get_candidate_trims(db, batch[0].brand, batch[0].model)
+                )
+
+            # whole slice scored by one cdist call instead of a match_trim call per listing
+            match_results = matching.match_trim_batch(
+                [
+                    matching.ListingInput(
+                        brand=listing.brand or "",
+                        model=listing.model or "",
+                        trim=listing.trim,
+                        title=listing.title,
+                    )
+                    for listing in batch
+                ],
+                {key: candidate_trims},
+                allow_external_llm=True,          # or False to run cheaper/faster passes
+                fuzzy_primary_threshold=82,
+                fuzzy_secondary_threshold=74,
+                min_ai_confidence=0.55,
+            )
+
+            for listing, match_result in zip(batch, match_results):
+                method = match_result.get("assignment_method", "unmatched")
+                conf = match_result.get("confidence", 0.0)
+
+                update_rows.append({
+                    "ad_id": listing.ad_id,
+                    "normalized_trim": match_result.get("trim"),
+                    "trim_confidence": conf,
+                    "assignment_method": method,
+                    "needs_review": (method == "unmatched"),
+                    "processed_at": now,
+                })
+                history_rows.append({
+                    "listing_id": listing.ad_id,
+                    "old_trim": listing.normalized_trim,
+                    "new_trim": match_result.get("trim") or "",
+                    "changed_by": "system_bulk_reprocess",
+                    "changed_at": now,
+                })
+
+                stats_methods[method] += 1
+                if conf >= 0.75:
+                    stats_confidence["high"] += 1
+                elif conf >= 0.4:
+                    stats_confidence["medium"] += 1
+                else:
+                    stats_confidence["low"] += 1
+
+                processed_count += 1
+
+            # Commit every batch_size records; small groups share a batch, a full
+            # slice of a large one commits on its own
+            if len(update_rows) >= batch_size:
+                flush()
+
+    flush()
+    if not processed_count:
+        return {"status": "ok", "message": "No processed listings found for the given filters"}
 
-        # Commit every batch_size records
-        if processed_count % batch_size == 0:
-            db.commit()
+    clear_stats_cache()
 
-    db.commit()
     return {
         "status": "ok",
         "processed": processed_count,
         "methods": dict(stats_methods),
         "confidence": dict(stats_confidence)
     }
-# # ----------------------
-# # Bulk reprocess processed listings
-# # ----------------------
-# @router.post("/reprocess-processed")
-# def reprocess_processed_listings(
-#     limit: int = Query(500, ge=1, le=5000),  # batch size
-#     db: Session = Depends(get_db)
-# ):
-#     """
-#     Reprocess listings that were already processed before.
-#     Skips manual assignments.
-#     """
-#     # 1. Fetch already processed (but not manual) listings
-#     listings = (
-#         db.query(models.Listings)
-#         .filter(
-#             models.Listings.processed_at.isnot(None),
-#             models.Listings.assignment_method != "manual"
-#         )
-#         .limit(limit)
-#         .all()
-#     )
-
-#     if not listings:
-#         return {"status": "done", "message": "No eligible listings found"}
-
-#     reprocessed_count = 0
-#     method_counts = {"exact": 0, "fuzzy": 0, "LLM": 0, "unmatched": 0}
-
-#     for listing in listings:
-#         candidate_trims = matching.get_candidate_trims(db, listing.brand, listing.model)
-
-#         # Build lightweight object for matcher
-#         listing_obj = type("Obj", (object,), {
-#             "trim": listing.trim,
-#             "brand": listing.brand,
-#             "model": listing.model,
-#             "title": getattr(listing, "title", None),
-#             "description": getattr(listing, "description", None)
-#         })
-
-#         match_result = matching.match_trim(listing_obj, candidate_trims)
-
-#         # Record old trim
-#         old_trim = listing.normalized_trim
-
-#         # Update listing
-#         listing.normalized_trim = match_result.get("trim")
-#         listing.trim_confidence = match_result.get("confidence", 0.0)
-#         listing.assignment_method = match_result.get("assignment_method", "unmatched")
-#         listing.needs_review = (listing.assignment_method == "unmatched")
-#         listing.processed_at = datetime.utcnow()
-
-#         # Count methods
-#         method = listing.assignment_method
-#         if method in method_counts:
-#             method_counts[method] += 1
-#         else:
-#             method_counts["unmatched"] += 1
-
-#         # Record history
-#         history = models.TrimHistory(
-#             listing_id=listing.ad_id,
-#             old_trim=old_trim,
-#             new_trim=listing.normalized_trim,
-#             changed_by="system_bulk_reprocess",
-#             changed_at=datetime.utcnow()
-#         )
-#         db.add(history)
-
-#         reprocessed_count += 1
-
-#     db.commit()
-
-#     return {
-#         "status": "ok",
-#         "reprocessed": reprocessed_count,
-#         "method_counts": method_counts
-#     }
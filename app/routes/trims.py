@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import exists
 from typing import List, Optional
 from app.database import SessionLocal
 from app import models, schemas
+from app.matching import clear_candidate_cache
+from app.normalization import compact
 router = APIRouter()
 
 # Dependency
@@ -27,29 +29,26 @@ def list_trims(
 
     query = db.query(models.TrimMaster)
 
-    # normalize function: lowercase + strip non-alphanumeric
-    normalize = lambda col: func.regexp_replace(func.lower(col), '[^a-z0-9]', '', 'g')
-
+    # make_norm/model_norm are generated columns (lowercase, non-alphanumerics stripped);
+    # normalizing the params the same way in Python lets the filters use ix_trim_master_norm
     if make:
-        query = query.filter(
-            normalize(models.TrimMaster.make) == func.regexp_replace(func.lower(make), '[^a-z0-9]', '', 'g')
-        )
+        query = query.filter(models.TrimMaster.make_norm == compact(make))
     if model:
-        query = query.filter(
-            normalize(models.TrimMaster.model) == func.regexp_replace(func.lower(model), '[^a-z0-9]', '', 'g')
-        )
+        query = query.filter(models.TrimMaster.model_norm == compact(model))
 
     trims = query.offset(skip).limit(limit).all()
     return trims
 # ----- POST /trims -----
 @router.post("/trims", response_model=schemas.Trim)
 def add_trim(trim_in: schemas.TrimCreate, db: Session = Depends(get_db)):
-    # Prevent duplicates
-    existing = db.query(models.TrimMaster).filter_by(
-        make=trim_in.make,
-        model=trim_in.model,
-        trim_name=trim_in.trim_name
-    ).first()
+    # Prevent duplicates (EXISTS: no row fetched, no ORM instance built)
+    existing = db.query(
+        exists().where(
+            models.TrimMaster.make == trim_in.make,
+            models.TrimMaster.model == trim_in.model,
+            models.TrimMaster.trim_name == trim_in.trim_name
+        )
+    ).scalar()
 
     if existing:
         raise HTTPException(status_code=400, detail="Trim already exists")
@@ -64,5 +63,6 @@ def add_trim(trim_in: schemas.TrimCreate, db: Session = Depends(get_db)):
     db.add(trim)
     db.commit()
     db.refresh(trim)
+    clear_candidate_cache(trim.make, trim.model)
     return trim
 
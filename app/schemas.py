@@ -1,7 +1,10 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict
+from typing import Literal, Optional, List
 from datetime import datetime
 
+# Response-only models are read from ORM rows and never mutated: frozen
+RESPONSE_CONFIG = ConfigDict(from_attributes=True, frozen=True)
+
 # ----------------------
 # Alias schemas
 # ----------------------
@@ -13,15 +16,14 @@ class AliasCreate(AliasBase):
     pass
 
 class Alias(AliasBase):
+    model_config = RESPONSE_CONFIG
+
     id: int
     make: str
     model: str
     trim_name: str
     created_at: Optional[datetime]
 
-    class Config:
-        from_attributes = True  # Pydantic v2 replacement for orm_mode
-
 # ----------------------
 # Trim schemas
 # ----------------------
@@ -36,15 +38,17 @@ class TrimCreate(TrimBase):
     pass
 
 class Trim(TrimBase):
+    model_config = RESPONSE_CONFIG
+
     id: int
     created_at: Optional[datetime]
 
-    class Config:
-        from_attributes = True
-
 # ----------------------
 # Listing schemas
 # ----------------------
+# the canonical set matching._canonical_method folds every method name into
+AssignmentMethod = Literal["exact", "fuzzy", "LLM", "manual", "unmatched"]
+
 class ListingBase(BaseModel):
     ad_id: str
     brand: str
@@ -56,9 +60,11 @@ class UnprocessedListing(ListingBase):
     pass
 
 class ProcessedListing(ListingBase):
+    model_config = RESPONSE_CONFIG
+
     normalized_trim: Optional[str] = None
     trim_confidence: Optional[float] = None
-    assignment_method: Optional[str] = None
+    assignment_method: Optional[AssignmentMethod] = None
     needs_review: bool
     processed_at: Optional[datetime] = None
 
@@ -1,82 +1,126 @@
+import argparse
 import csv
 import time
-from datetime import datetime
-from sqlalchemy.orm import Session
-from app.database import SessionLocal, engine, Base
+from sqlalchemy import Connection, insert, select
+from app.database import engine, Base
 from app import models
 
 CSV_PATH = "car_trims.csv"
+BATCH_SIZE = 1000  # trims per multi-row INSERT
+SKIPPED_SAMPLE = 10  # empty-trim rows listed in the final log
 
 Base.metadata.create_all(bind=engine)
 
-def log(msg):
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
-
-def seed_trim_master():
-    start_time = time.time()
-    db: Session = SessionLocal()
-
-    skipped_rows = []
-    count_added = 0
-    seen = set()  # Track make/model/trim already processed in this run
-
-    log(f"Loading trims from {CSV_PATH}")
-    with open(CSV_PATH, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-
-        for idx, row in enumerate(reader, start=1):
-            make = row['Make'].strip()
-            model = row['Model'].strip()
-            trim_name = row['Trim'].strip()
-
-            if not trim_name:
-                skipped_rows.append((make, model))
-                continue
-
-            key = (make.lower(), model.lower(), trim_name.lower())
-            if key in seen:
-                continue  # Avoid duplicate insert in same run
-            seen.add(key)
-
-            # Check DB for existing trim
-            existing = db.query(models.TrimMaster).filter_by(
-                make=make,
-                model=model,
-                trim_name=trim_name
-            ).first()
-
-            if not existing:
-                trim_obj = models.TrimMaster(
-                    make=make,
-                    model=model,
-                    trim_name=trim_name
-                )
-                db.add(trim_obj)
-                db.flush()  # Assigns ID without commit
+_T0 = time.perf_counter()
 
-                alias = models.TrimAlias(
-                    trim_master_id=trim_obj.id,
-                    alias=trim_name.lower()
+def log(msg):
+    # elapsed since start instead of formatting the wall clock on every line
+    print(f"[{time.perf_counter() - _T0:7.2f}s] {msg}")
+
+def insert_trims(conn: Connection, trims: list[dict]) -> int:
+    """
+    Insert TrimMaster rows and their lowercase aliases: two multi-row Core INSERTs,
+    the new ids coming back from RETURNING in parameter order.
+    """
+    if not trims:
+        return 0
+    trim_master = models.TrimMaster.__table__
+    ids = conn.execute(
+        insert(trim_master).returning(trim_master.c.id, sort_by_parameter_order=True),
+        trims
+    ).scalars().all()
+    conn.execute(
+        insert(models.TrimAlias.__table__),
+        [
+            {"trim_master_id": trim_id, "alias": trim["trim_name"].lower()}
+            for trim_id, trim in zip(ids, trims)
+        ]
+    )
+    return len(ids)
+
+def seed_trim_master(bulk: bool = False):
+    start_time = time.perf_counter()
+    # one transaction on a plain connection for the whole run (Core only, no ORM
+    # session): committed when the block exits, rolled back if anything in it raises
+    with engine.begin() as conn:
+        skipped_count = 0
+        skipped_rows = []  # first SKIPPED_SAMPLE only, for the log
+        count_added = 0
+
+        # make/model/trim already in the DB or added in this run, loaded in one query
+        # keyed by one lowercased string (\x1f never occurs in the CSV) rather than
+        # a tuple of three lowercased strings: one allocation and one hash per row
+        existing = {
+            f"{make}\x1f{model}\x1f{trim_name}".lower()
+            for make, model, trim_name in conn.execute(
+                select(
+                    models.TrimMaster.make,
+                    models.TrimMaster.model,
+                    models.TrimMaster.trim_name
                 )
-                db.add(alias)
-
-                count_added += 1
-
-            if idx % 500 == 0:
-                log(f"Processed {idx} rows, added {count_added} trims so far")
-
-    db.commit()
-    db.close()
-
-    elapsed = time.time() - start_time
+            )
+        }
+        log(f"Found {len(existing)} trims already in the database")
+
+        # bulk load into empty tables: build the secondary indexes (the trigram GiST
+        # ones especially) once after the load instead of row by row; DDL is
+        # transactional, so a failed run rolls back with the indexes still in place
+        indexes = []
+        if bulk and not existing:
+            indexes = [*models.TrimMaster.__table__.indexes, *models.TrimAlias.__table__.indexes]
+            log(f"Bulk load: dropping {len(indexes)} indexes until the load is done")
+            for index in indexes:
+                index.drop(conn, checkfirst=True)
+        trims_batch = []
+
+        log(f"Loading trims from {CSV_PATH}")
+        with open(CSV_PATH, newline='', encoding='utf-8') as csvfile:
+            # plain rows instead of a dict per row; columns located once from the header
+            reader = csv.reader(csvfile)
+            header = next(reader)
+            columns = [header.index('Make'), header.index('Model'), header.index('Trim')]
+
+            for idx, row in enumerate(reader, start=1):
+                make, model, trim_name = (row[i].strip() for i in columns)
+
+                if not trim_name:
+                    skipped_count += 1
+                    if len(skipped_rows) < SKIPPED_SAMPLE:
+                        skipped_rows.append((make, model))
+                    continue
+
+                key = f"{make}\x1f{model}\x1f{trim_name}".lower()
+                if key not in existing:
+                    existing.add(key)
+                    trims_batch.append({"make": make, "model": model, "trim_name": trim_name})
+
+                    if len(trims_batch) >= BATCH_SIZE:
+                        count_added += insert_trims(conn, trims_batch)
+                        trims_batch.clear()
+                        # progress once per flushed batch, not per N rows
+                        log(f"Processed {idx} rows, added {count_added} trims so far")
+
+        count_added += insert_trims(conn, trims_batch)
+
+        for index in indexes:
+            index.create(conn)
+        if indexes:
+            log(f"Rebuilt {len(indexes)} indexes")
+
+    elapsed = time.perf_counter() - start_time
     log(f"✅ Finished: {count_added} trims added in {elapsed:.2f} seconds.")
-    if skipped_rows:
-        log(f"⚠️ Skipped {len(skipped_rows)} rows with empty trims.")
-        for make, model in skipped_rows[:10]:  # Only show first 10 skipped
+    if skipped_count:
+        log(f"⚠️ Skipped {skipped_count} rows with empty trims.")
+        for make, model in skipped_rows:
             log(f"   - {make} {model}")
-        if len(skipped_rows) > 10:
-            log(f"   ... +{len(skipped_rows)-10} more skipped")
+        if skipped_count > len(skipped_rows):
+            log(f"   ... +{skipped_count - len(skipped_rows)} more skipped")
 
 
 if __name__ == "__main__":
-    seed_trim_master()
+    parser = argparse.ArgumentParser(description="Seed trim_master and trim_alias from the trims CSV")
+    parser.add_argument(
+        "--bulk", action="store_true",
+        help="on an empty database, rebuild the trim indexes after the load instead of maintaining them per row"
+    )
+    seed_trim_master(bulk=parser.parse_args().bulk)